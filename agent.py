@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Headless scan agent for Network Dashboard
+Scans the local network and pushes batched device changes to a central dashboard
+"""
+
+import argparse
+import gzip
+import json
+import socket
+import time
+import uuid
+from datetime import datetime
+
+import requests
+
+from config import Config
+from app.scanner import NetworkScanner
+
+# Fields whose change makes the agent resend a device in full
+TRACKED_FIELDS = ('ip', 'mac', 'hostname', 'vendor', 'device_type', 'open_ports', 'ipv6_addresses', 'services')
+
+class ScanAgent:
+    """Runs scans with NetworkScanner and ships the deltas to /api/ingest"""
+
+    def __init__(self, server_url, token, name, network_range=None, batch_size=Config.AGENT_BATCH_SIZE, timeout=30):
+        self.ingest_url = server_url.rstrip('/') + '/api/ingest'
+        self.token = token
+        self.name = name
+        self.network_range = network_range
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.scanner = NetworkScanner()
+        self.session = requests.Session()
+        self.known_devices = {}  # last scan results keyed by MAC, for incremental enrichment
+        self.sent = {}  # device key -> tracked fields the server last acknowledged
+
+    @staticmethod
+    def device_key(device):
+        return device.get('mac') or device.get('ip')
+
+    @staticmethod
+    def fingerprint(device):
+        return tuple(
+            tuple(device.get(field) or ()) if field in ('open_ports', 'ipv6_addresses')
+            else json.dumps(device.get(field), sort_keys=True) if field == 'services'
+            else device.get(field)
+            for field in TRACKED_FIELDS
+        )
+
+    def scan_once(self):
+        """Scan and push one round of results, returns True when the server accepted all of it"""
+        devices, duration = self.scanner.full_scan(
+            known_devices=self.known_devices if Config.INCREMENTAL_SCAN else None,
+            network_ranges=self.network_range
+        )
+        for device in devices:
+            if device.get('mac'):
+                self.known_devices[device['mac']] = {
+                    'ip_address': device['ip'],
+                    'hostname': device['hostname'],
+                    'open_ports': device['open_ports'],
+                    'hostname_checked_at': device.get('hostname_checked_at'),
+                    'ports_checked_at': device.get('ports_checked_at')
+                }
+
+        changed, seen = [], []
+        for device in devices:
+            if self.sent.get(self.device_key(device)) == self.fingerprint(device):
+                seen.append([device.get('mac'), device['ip']])
+            else:
+                changed.append(device)
+        ranges = [str(network) for network in self.scanner.get_network_ranges(self.network_range)]
+
+        batches = [changed[i:i + self.batch_size] for i in range(0, len(changed), self.batch_size)] or [[]]
+        scan = {
+            'id': uuid.uuid4().hex,
+            'batches': len(batches),
+            'ranges': ranges,
+            'devices_found': len(devices),
+            'duration': duration
+        }
+        for index, batch in enumerate(batches):
+            payload = {
+                'agent': self.name,
+                'scan': dict(scan, batch=index),
+                'devices': [self.serialize(device) for device in batch],
+                # Unchanged devices only need their sighting refreshed
+                'seen': seen if index == 0 else []
+            }
+            result = self.push(payload)
+            if result is None:
+                # Unacknowledged devices stay unsent and are retried next round
+                return False
+            for device in batch:
+                self.sent[self.device_key(device)] = self.fingerprint(device)
+            # The server no longer has these (deleted or reset), send them in full next round
+            for mac, ip in result.get('unknown') or []:
+                self.sent.pop(mac or ip, None)
+
+        print(f"Pushed {len(changed)} changed and {len(seen)} unchanged devices in {len(batches)} batch(es)")
+        return True
+
+    @staticmethod
+    def serialize(device):
+        return {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in device.items()
+        }
+
+    def push(self, payload):
+        """POST one gzip compressed batch to the dashboard, returns its JSON reply or None when it failed"""
+        body = gzip.compress(json.dumps(payload).encode('utf-8'))
+        try:
+            response = self.session.post(
+                self.ingest_url,
+                data=body,
+                headers={
+                    'Authorization': f'Bearer {self.token}',
+                    'Content-Type': 'application/json',
+                    'Content-Encoding': 'gzip'
+                },
+                timeout=self.timeout,
+                allow_redirects=False
+            )
+        except requests.RequestException as e:
+            print(f"Error pushing batch to {self.ingest_url}: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"Dashboard rejected batch: HTTP {response.status_code} {response.text[:200]}")
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    def run(self, interval):
+        """Scan every interval seconds until interrupted"""
+        while True:
+            started = time.time()
+            try:
+                self.scan_once()
+            except Exception as e:
+                print(f"Agent scan error: {e}")
+            time.sleep(max(0, interval - (time.time() - started)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard Scan Agent')
+    parser.add_argument('--server', default=Config.AGENT_SERVER_URL, help='Central dashboard URL')
+    parser.add_argument('--token', default=Config.AGENT_TOKEN, help='Agent token (one of AGENT_TOKENS on the server)')
+    parser.add_argument('--name', default=None, help='Agent name shown in the scan log (default: hostname)')
+    parser.add_argument('--network-range', default=None, help='Comma separated CIDRs to scan (default: Config.NETWORK_RANGE)')
+    parser.add_argument('--interval', type=int, default=Config.SCAN_INTERVAL, help='Seconds between scans')
+    parser.add_argument('--batch-size', type=int, default=Config.AGENT_BATCH_SIZE, help='Devices per ingest request')
+    parser.add_argument('--once', action='store_true', help='Scan and push once, then exit')
+
+    args = parser.parse_args()
+    if not args.token:
+        parser.error('an agent token is required (--token or AGENT_TOKEN)')
+
+    agent = ScanAgent(
+        args.server,
+        args.token,
+        args.name or socket.gethostname(),
+        network_range=args.network_range,
+        batch_size=args.batch_size
+    )
+    if args.once:
+        raise SystemExit(0 if agent.scan_once() else 1)
+    agent.run(args.interval)
+
+if __name__ == '__main__':
+    main()
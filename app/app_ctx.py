@@ -1,3 +0,0 @@
-from app import create_app
-
-app = create_app()
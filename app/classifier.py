@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import threading
+
+from config import Config as conf
+
+# this file classifies devices from the rules in device_rules.json
+
+UNKNOWN = 'Unknown'
+
+
+class _TermMatcher:
+    """One compiled regex finding every rule term that occurs in a text"""
+
+    def __init__(self, term_rules):
+        # term_rules: {lowercase term: set of rule indexes}
+        terms = sorted(term_rules, key=len, reverse=True)
+        self._regex = None
+        if terms:
+            # The lookahead tries every position and the longest term there wins
+            self._regex = re.compile('(?=(' + '|'.join(map(re.escape, terms)) + '))')
+        # A hit on a term means every term it contains occurs as well
+        self._implied = {
+            term: frozenset(i for other, rules in term_rules.items() if other in term for i in rules)
+            for term in terms
+        }
+
+    def match(self, text):
+        if not text or self._regex is None:
+            return set()
+        found = set()
+        for match in self._regex.finditer(text.lower()):
+            found |= self._implied[match.group(1)]
+        return found
+
+
+class DeviceClassifier:
+    """Rule engine mapping vendor, hostname, open ports and service banners to a device type.
+
+    Each rule has a type, a priority and any of: vendor substrings, hostname
+    substrings, port signatures (lists of ports that must all be open) and
+    banner substrings (matched against SSH versions, HTTP Server headers and
+    TLS certificate CNs from app/fingerprint.py).
+    The highest priority matching rule wins, ties go to the earlier rule.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        vendor_terms, hostname_terms, banner_terms = {}, {}, {}
+        self._port_signatures = []
+        for index, rule in enumerate(rules):
+            for term in rule.get('vendor', []):
+                vendor_terms.setdefault(term.lower(), set()).add(index)
+            for term in rule.get('hostname', []):
+                hostname_terms.setdefault(term.lower(), set()).add(index)
+            for term in rule.get('banner', []):
+                banner_terms.setdefault(term.lower(), set()).add(index)
+            for signature in rule.get('ports', []):
+                self._port_signatures.append((frozenset(signature), index))
+        self._vendor = _TermMatcher(vendor_terms)
+        self._hostname = _TermMatcher(hostname_terms)
+        self._banner = _TermMatcher(banner_terms)
+        self._rank = {
+            index: (rule.get('priority', 0), -index) for index, rule in enumerate(rules)
+        }
+        self._memo = {}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f).get('rules', []))
+
+    def classify(self, vendor=None, hostname=None, open_ports=None, services=None):
+        """Return the device type for one device"""
+        ports = frozenset(open_ports or ())
+        banners = '\n'.join(
+            text for service in services or () for text in (service.get('banner'), service.get('cn')) if text
+        )
+        key = (vendor, hostname, ports, banners)
+        device_type = self._memo.get(key)
+        if device_type is None:
+            matched = self._vendor.match(vendor) | self._hostname.match(hostname) | self._banner.match(banners)
+            if ports:
+                matched.update(i for signature, i in self._port_signatures if signature <= ports)
+            device_type = self.rules[max(matched, key=self._rank.get)]['type'] if matched else UNKNOWN
+            if len(self._memo) >= 65536:
+                self._memo.clear()
+            self._memo[key] = device_type
+        return device_type
+
+    def classify_many(self, devices):
+        """Classify a batch of device dicts (vendor, hostname, open_ports, services keys) in one pass"""
+        classify = self.classify
+        return [
+            classify(d.get('vendor'), d.get('hostname'), d.get('open_ports'), d.get('services'))
+            for d in devices
+        ]
+
+
+_classifier = None
+_classifier_mtime = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """Return the shared classifier, recompiling it when the rules file changes"""
+    global _classifier, _classifier_mtime
+    path = conf.DEVICE_RULES_FILE
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _classifier_lock:
+        if _classifier is None or mtime != _classifier_mtime:
+            try:
+                _classifier = DeviceClassifier.from_file(path)
+            except (OSError, ValueError) as e:
+                print(f"Could not load device rules from {path}: {e}")
+                if _classifier is None:
+                    _classifier = DeviceClassifier([])
+            _classifier_mtime = mtime
+        return _classifier
@@ -0,0 +1,106 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from config import Config as conf
+
+# this file caches reverse DNS lookups across scans
+
+
+class ReverseDNSCache:
+    """LRU cache of PTR lookups with separate TTLs for answers and misses"""
+
+    def __init__(self, ttl=86400, negative_ttl=900, max_size=4096, timeout=2, workers=16,
+                 resolver=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.timeout = timeout
+        self.resolver = resolver or (lambda ip: socket.gethostbyaddr(ip)[0])
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # ip -> (hostname or None, expires_at)
+        self._pending = {}  # ip -> Future of an in-flight lookup
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rdns')
+
+    def get(self, ip):
+        """Return (found, hostname) from the cache without resolving"""
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                return False, None
+            hostname, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[ip]
+                return False, None
+            self._entries.move_to_end(ip)
+            return True, hostname
+
+    def lookup(self, ip, refresh=False):
+        """Resolve an IP to a hostname, waiting at most self.timeout seconds
+
+        refresh skips a cached answer and resolves again, updating the cache.
+        """
+        found, hostname = (False, None) if refresh else self.get(ip)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return hostname
+        return self._wait(ip, self._submit(ip))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _submit(self, ip):
+        # Concurrent callers asking for the same IP share one lookup
+        with self._lock:
+            future = self._pending.get(ip)
+            if future is None:
+                future = self._executor.submit(self._resolve, ip)
+                self._pending[ip] = future
+            return future
+
+    def _wait(self, ip, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # Remember the miss now; the lookup keeps running and overwrites it if it answers
+            self._store(ip, None, only_if_missing=True)
+            return None
+
+    def _resolve(self, ip):
+        try:
+            hostname = self.resolver(ip)
+        except (OSError, UnicodeError):
+            hostname = None
+        self._store(ip, hostname)
+        with self._lock:
+            self._pending.pop(ip, None)
+        return hostname
+
+    def _store(self, ip, hostname, only_if_missing=False):
+        ttl = self.ttl if hostname else self.negative_ttl
+        with self._lock:
+            if only_if_missing and ip in self._entries:
+                return
+            self._entries[ip] = (hostname, time.monotonic() + ttl)
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+# Shared by every scan in the process
+reverse_dns = ReverseDNSCache(
+    ttl=conf.DNS_CACHE_TTL,
+    negative_ttl=conf.DNS_NEGATIVE_TTL,
+    max_size=conf.DNS_CACHE_SIZE,
+    timeout=conf.DNS_TIMEOUT,
+    workers=conf.DNS_WORKERS
+)
@@ -0,0 +1,186 @@
+import asyncio
+import ssl
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config as conf
+
+# this file reads service banners from open ports and caches them per (MAC, port)
+
+TLS_PORTS = {443, 465, 636, 853, 993, 995, 5986, 8443}
+HTTPS_PORTS = {443, 5986, 8443}
+OID_COMMON_NAME = b'\x55\x04\x03'
+MAX_BANNER_LENGTH = 200
+
+
+def _clean(raw):
+    """First line of a banner as printable text"""
+    line = raw.decode('latin-1').strip().splitlines()[0] if raw.strip() else ''
+    return ''.join(c for c in line if c.isprintable())[:MAX_BANNER_LENGTH]
+
+
+def _http_server(response):
+    """Server header of a raw HTTP response, '' when it has none"""
+    for line in response.decode('latin-1').split('\r\n')[1:]:
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'server':
+            return _clean(value.encode('latin-1'))
+    return ''
+
+
+def _der_items(data):
+    """Split DER encoded data into (tag, value) pairs"""
+    items = []
+    offset = 0
+    while offset < len(data):
+        tag, length = data[offset], data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            size = length & 0x7F
+            length = int.from_bytes(data[offset:offset + size], 'big')
+            offset += size
+        items.append((tag, data[offset:offset + length]))
+        offset += length
+    return items
+
+
+def certificate_common_name(der):
+    """Subject CN of a DER certificate, None when it has none"""
+    try:
+        tbs = _der_items(_der_items(der)[0][1])[0][1]
+        fields = _der_items(tbs)
+        if fields[0][0] == 0xA0:  # explicit version
+            fields = fields[1:]
+        subject = fields[4][1]  # after serial, signature, issuer and validity
+        for _, rdn in _der_items(subject):
+            for _, attribute in _der_items(rdn):
+                (_, oid), (_, value) = _der_items(attribute)[:2]
+                if oid == OID_COMMON_NAME:
+                    return value.decode('utf-8', 'replace')
+    except (IndexError, ValueError):
+        pass
+    return None
+
+
+async def _read(reader, timeout, limit=4096):
+    try:
+        return await asyncio.wait_for(reader.read(limit), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return b''
+
+
+async def fingerprint_port(ip, port, timeout=2, banner_wait=0.5):
+    """Identify the service on one open port.
+
+    Reads what the server sends first (SSH and most mail/FTP servers
+    greet the client), otherwise sends an HTTP HEAD request. Ports in
+    TLS_PORTS are wrapped in TLS first and report the certificate CN.
+    Returns {'port', 'service', 'banner', 'cn'} or None.
+    """
+    context = None
+    if port in TLS_PORTS:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port, ssl=context), timeout)
+    except (asyncio.TimeoutError, OSError, ssl.SSLError):
+        return None
+
+    result = {'port': port, 'service': None, 'banner': '', 'cn': None}
+    try:
+        if context is not None:
+            ssl_object = writer.get_extra_info('ssl_object')
+            result['service'] = 'tls'
+            result['cn'] = certificate_common_name(ssl_object.getpeercert(binary_form=True) or b'')
+
+        greeting = b'' if port in HTTPS_PORTS else await _read(reader, banner_wait)
+        if greeting.startswith(b'SSH-'):
+            result['service'], result['banner'] = 'ssh', _clean(greeting)
+        elif greeting:
+            result['service'], result['banner'] = result['service'] or 'banner', _clean(greeting)
+        else:
+            writer.write(f'HEAD / HTTP/1.0\r\nHost: {ip}\r\n\r\n'.encode('ascii'))
+            await writer.drain()
+            response = await _read(reader, timeout)
+            if response.startswith(b'HTTP/'):
+                result['service'] = 'https' if context is not None else 'http'
+                result['banner'] = _http_server(response)
+    except (OSError, ssl.SSLError, UnicodeError):
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+    return result if result['service'] else None
+
+
+class ServiceCache:
+    """LRU cache of fingerprints keyed by (MAC, port), ports that told nothing are cached too"""
+
+    def __init__(self, ttl=86400, max_size=16384):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (mac, port) -> (result or None, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, mac, port):
+        """Return (found, result) without probing"""
+        with self._lock:
+            entry = self._entries.get((mac, port))
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop((mac, port), None)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end((mac, port))
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, mac, port, result):
+        with self._lock:
+            self._entries[(mac, port)] = (result, time.monotonic() + self.ttl)
+            self._entries.move_to_end((mac, port))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+async def fingerprint_services(ip, mac, ports, limiter, cache=None, timeout=2, pacer=None, fingerprint=None):
+    """Fingerprint the open ports of one host concurrently, holding a limiter slot per probe.
+
+    Results still in the cache are reused; devices without a MAC are cached by IP.
+    fingerprint replaces fingerprint_port (a ProbeBackend's fingerprint).
+    Returns the identified services sorted by port.
+    """
+    key = mac or ip
+    fingerprint = fingerprint or fingerprint_port
+
+    async def probe(port):
+        if cache is not None:
+            found, result = cache.get(key, port)
+            if found:
+                return result
+        async with limiter:
+            if pacer:
+                await pacer.acquire()
+            result = await fingerprint(ip, port, timeout)
+        if cache is not None:
+            cache.put(key, port, result)
+        return result
+
+    results = await asyncio.gather(*(probe(port) for port in sorted(ports)))
+    return [result for result in results if result]
+
+
+# Shared by every scan in the process
+service_cache = ServiceCache(ttl=conf.SERVICE_CACHE_TTL, max_size=conf.SERVICE_CACHE_SIZE)
@@ -4,39 +4,21 @@ import hashlib
 import os
 
 class User:
-    @staticmethod
-    def create_table():
-        from app.models import DatabaseManager
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
     @staticmethod
     def set_user(username, password):
         from app.models import DatabaseManager
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        password_hash = User.hash_password(password)
-        cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, password_hash))
-        conn.commit()
-        conn.close()
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
+            password_hash = User.hash_password(password)
+            cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, password_hash))
 
     @staticmethod
     def check_user(username, password):
         from app.models import DatabaseManager
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT password_hash FROM users WHERE username = ?', (username,))
-        row = cursor.fetchone()
-        conn.close()
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT password_hash FROM users WHERE username = ?', (username,))
+            row = cursor.fetchone()
         if row:
             return User.verify_password(password, row[0])
         return False
@@ -44,11 +26,10 @@ class User:
     @staticmethod
     def user_exists():
         from app.models import DatabaseManager
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM users')
-        count = cursor.fetchone()[0]
-        conn.close()
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM users')
+            count = cursor.fetchone()[0]
         return count > 0
 
     @staticmethod
@@ -61,16 +42,139 @@ class User:
         return User.hash_password(password) == hash_
 import sqlite3
 import json
-from datetime import datetime, timedelta
+import ipaddress
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from flask import current_app
 
+from config import Config as conf
+
 # this file deals with database operations and models
 
 class DatabaseManager:
+    """Pooled SQLite connections in WAL mode.
+
+    Reads check a query-only connection out of a per-database pool and
+    writes go through one shared connection per database, serialized by a
+    lock. In WAL mode readers see the last committed state and never wait
+    for a scan's write transaction. Pooled connections outlive the thread
+    or greenlet that used them, so their prepared statement caches are
+    reused across requests.
+    """
+
+    _readers = {}  # database path -> idle read connections
+    _writers = {}  # database path -> write connection
+    _pool_lock = threading.Lock()
+    _write_lock = threading.RLock()
+    _commit_callbacks = []  # of the open write transaction
+    _pid = os.getpid()
+
+    @staticmethod
+    def _connect(path, read_only=False):
+        """Open a connection with the pragmas every pooled connection runs with"""
+        conn = sqlite3.connect(
+            path,
+            isolation_level=None,  # transactions are begun explicitly by reader() and writer()
+            check_same_thread=False,
+            cached_statements=conf.DB_STATEMENT_CACHE_SIZE
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(conf.DB_BUSY_TIMEOUT * 1000)}")
+        if not read_only:
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{int(conf.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(conf.DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @staticmethod
+    def _check_fork():
+        """Forget connections inherited from a parent process, they must not be shared"""
+        if DatabaseManager._pid != os.getpid():
+            DatabaseManager._pid = os.getpid()
+            DatabaseManager._readers = {}
+            DatabaseManager._writers = {}
+
+    @staticmethod
+    def _write_connection(path):
+        conn = DatabaseManager._writers.get(path)
+        if conn is None:
+            conn = DatabaseManager._writers[path] = DatabaseManager._connect(path)
+        return conn
+
+    @staticmethod
+    @contextmanager
+    def reader():
+        """Pooled read connection whose queries all see one consistent snapshot"""
+        DatabaseManager._check_fork()
+        path = current_app.config['DATABASE_PATH']
+        with DatabaseManager._pool_lock:
+            idle = DatabaseManager._readers.setdefault(path, [])
+            conn = idle.pop() if idle else None
+        if conn is None:
+            # The writer opens first so the database is in WAL mode before anything reads it
+            with DatabaseManager._write_lock:
+                DatabaseManager._write_connection(path)
+            conn = DatabaseManager._connect(path, read_only=True)
+
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+            with DatabaseManager._pool_lock:
+                idle = DatabaseManager._readers.setdefault(path, [])
+                if len(idle) < conf.DB_READ_POOL_SIZE:
+                    idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
     @staticmethod
-    def get_connection():
-        """Get database connection"""
-        return sqlite3.connect(current_app.config['DATABASE_PATH'])
+    @contextmanager
+    def writer():
+        """Shared write connection inside one transaction, committed on success and rolled back on errors"""
+        DatabaseManager._check_fork()
+        with DatabaseManager._write_lock:
+            conn = DatabaseManager._write_connection(current_app.config['DATABASE_PATH'])
+            if conn.in_transaction:  # nested writers join the outer transaction
+                yield conn
+                return
+            # IMMEDIATE takes the write lock up front instead of failing to upgrade a read lock later
+            conn.execute("BEGIN IMMEDIATE")
+            DatabaseManager._commit_callbacks = []
+            try:
+                yield conn
+            except BaseException:
+                DatabaseManager._commit_callbacks = []
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            callbacks, DatabaseManager._commit_callbacks = DatabaseManager._commit_callbacks, []
+            for callback in callbacks:
+                callback()
+
+    @staticmethod
+    def on_commit(callback):
+        """Run callback once the current writer() transaction commits, still holding the write lock"""
+        DatabaseManager._commit_callbacks.append(callback)
+
+    @staticmethod
+    def close_all():
+        """Close every pooled connection, e.g. before the database file is moved or removed"""
+        with DatabaseManager._write_lock, DatabaseManager._pool_lock:
+            for conn in DatabaseManager._writers.values():
+                conn.close()
+            for idle in DatabaseManager._readers.values():
+                for conn in idle:
+                    conn.close()
+            DatabaseManager._writers.clear()
+            DatabaseManager._readers.clear()
 
     @staticmethod
     def dict_factory(cursor, row):
@@ -81,21 +185,45 @@ class DatabaseManager:
         return d
 
 class Device:
+    LOOKUP_CHUNK = 500  # keys per IN (...) query, below SQLite's bound parameter limit
+    # Devices are keyed by MAC address, MAC-less ones by source and IP address (partial unique index)
+    UPSERT_SQL = """
+        INSERT INTO devices (
+            ip_address, mac_address, hostname, vendor, device_type, open_ports, method,
+            hostname_checked_at, ports_checked_at, ipv6_addresses, services, source,
+            first_seen, last_seen, is_active
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT {conflict} DO UPDATE SET
+            ip_address = excluded.ip_address,
+            source = excluded.source,
+            hostname = excluded.hostname,
+            vendor = excluded.vendor,
+            device_type = excluded.device_type,
+            open_ports = excluded.open_ports,
+            method = excluded.method,
+            last_seen = excluded.last_seen,
+            is_active = 1,
+            hostname_checked_at = COALESCE(excluded.hostname_checked_at, hostname_checked_at),
+            ports_checked_at = COALESCE(excluded.ports_checked_at, ports_checked_at),
+            ipv6_addresses = COALESCE(excluded.ipv6_addresses, ipv6_addresses),
+            services = COALESCE(excluded.services, services)
+    """
+
     @staticmethod
     def get_all():
         """Get all devices from database"""
-        conn = DatabaseManager.get_connection()
-        conn.row_factory = DatabaseManager.dict_factory
-        cursor = conn.cursor()
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = DatabaseManager.dict_factory
 
-        cursor.execute("""
-            SELECT id, ip_address, mac_address, hostname, vendor, device_type, first_seen, last_seen, is_active, open_ports, method
-            FROM devices
-            ORDER BY last_seen DESC
-        """)
+            cursor.execute("""
+                SELECT id, ip_address, mac_address, hostname, vendor, device_type, first_seen, last_seen, is_active, open_ports, method,
+                       ipv6_addresses, services
+                FROM devices
+                ORDER BY last_seen DESC
+            """)
 
-        devices = cursor.fetchall()
-        conn.close()
+            devices = cursor.fetchall()
 
         # Parse JSON fields
         for device in devices:
@@ -109,165 +237,533 @@ class Device:
             # method may be None if not set
             if 'method' not in device:
                 device['method'] = None
+            try:
+                device['ipv6_addresses'] = json.loads(device['ipv6_addresses']) if device['ipv6_addresses'] else []
+            except ValueError:
+                device['ipv6_addresses'] = []
+            try:
+                device['services'] = json.loads(device['services']) if device['services'] else []
+            except ValueError:
+                device['services'] = []
 
         return devices
 
     @staticmethod
     def get_active(hours=1):
         """Get devices active within specified hours"""
-        conn = DatabaseManager.get_connection()
-        conn.row_factory = DatabaseManager.dict_factory
-        cursor = conn.cursor()
-
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        cursor.execute("""
-            SELECT id, ip_address, mac_address, hostname, vendor, device_type, first_seen, last_seen, is_active, open_ports
-            FROM devices
-            WHERE last_seen > ? AND is_active = 1
-            ORDER BY last_seen DESC
-        """, (cutoff_time,))
-
-        devices = cursor.fetchall()
-        conn.close()
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = DatabaseManager.dict_factory
+
+            cutoff_time = datetime.now() - timedelta(hours=hours)
+            cursor.execute("""
+                SELECT id, ip_address, mac_address, hostname, vendor, device_type, first_seen, last_seen, is_active, open_ports
+                FROM devices
+                WHERE last_seen > ? AND is_active = 1
+                ORDER BY last_seen DESC
+            """, (cutoff_time,))
+
+            devices = cursor.fetchall()
         return devices
 
+    @staticmethod
+    def get_known_state():
+        """Get the last stored enrichment state of every device, keyed by MAC address"""
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = DatabaseManager.dict_factory
+
+            cursor.execute("""
+                SELECT mac_address, ip_address, hostname, vendor, device_type, open_ports,
+                       hostname_checked_at, ports_checked_at
+                FROM devices
+                WHERE mac_address IS NOT NULL
+            """)
+
+            rows = cursor.fetchall()
+
+        known = {}
+        for row in rows:
+            try:
+                row['open_ports'] = json.loads(row['open_ports']) if row['open_ports'] else []
+            except ValueError:
+                row['open_ports'] = []
+            for field in ('hostname_checked_at', 'ports_checked_at'):
+                try:
+                    row[field] = datetime.fromisoformat(row[field]) if row[field] else None
+                except (TypeError, ValueError):
+                    row[field] = None
+            known[row['mac_address']] = row
+        return known
+
+    @staticmethod
+    def normalize_mac(mac):
+        """Lowercase, colon separated form of a MAC address (Windows arp -a uses dashes), None when there is none"""
+        return mac.strip().lower().replace('-', ':') if mac else None
+
     @staticmethod
     def upsert(device_data):
-        """Insert or update device information, tracking first_seen and last_seen"""
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
+        """Insert or update one device, tracking first_seen and last_seen"""
+        return Device.bulk_upsert([device_data])
 
-        # Convert open_ports list to JSON string
-        if 'open_ports' in device_data and isinstance(device_data['open_ports'], list):
-            device_data['open_ports'] = json.dumps(device_data['open_ports'])
+    @staticmethod
+    def bulk_upsert(devices, source=''):
+        """Insert or update a batch of devices in one transaction, keeping first_seen of known ones.
+
+        Devices are keyed by MAC address, devices without one by IP address
+        within source ('' for this server's scans, 'agent:<name>' for an agent).
+        Returns {'inserted': [...], 'updated': [...]} with the keys of the devices
+        and the UTC 'last_seen' timestamp stored for all of them.
+        """
+        seen_at = DeviceHistory.utcnow()
+        last_seen = seen_at.strftime(DeviceHistory.TIME_FORMAT)
+        with_mac, without_mac = [], []
+        for device_data in devices:
+            row = Device._row(device_data, source) + (last_seen, last_seen)
+            (with_mac if row[1] else without_mac).append(row)
+
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
+            previous = Device._previous_state(cursor, [row[1] for row in with_mac], [row[0] for row in without_mac],
+                                              source)
+            # ids only grow (AUTOINCREMENT), so rows above the current maximum are the inserted ones
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM devices")
+            last_id = cursor.fetchone()[0]
+            if with_mac:
+                cursor.executemany(Device.UPSERT_SQL.format(conflict='(mac_address)'), with_mac)
+            if without_mac:
+                cursor.executemany(Device.UPSERT_SQL.format(conflict='(source, ip_address) WHERE mac_address IS NULL'),
+                                   without_mac)
+            cursor.execute("SELECT COALESCE(mac_address, ip_address), id FROM devices WHERE id > ?", (last_id,))
+            inserted = dict(cursor.fetchall())
+
+            sightings = []
+            for row in with_mac + without_mac:
+                key = row[1] or row[0]
+                device_id, previous_ip, previous_seen = previous.get(key) or (inserted[key], None, None)
+                sightings.append((device_id, row[0], row[6], previous_ip, previous_seen))
+            DeviceHistory.record(cursor, sightings, seen_at)
+            Stats.record_changes(cursor, inserted=len(inserted), seen_ids=[sighting[0] for sighting in sightings])
+
+        keys = dict.fromkeys(row[1] or row[0] for row in with_mac + without_mac)
+        updated = [key for key in keys if key not in inserted]
+        return {'inserted': list(inserted), 'updated': updated, 'last_seen': last_seen}
 
-        # Check if device exists (by MAC address)
-        cursor.execute("SELECT id, first_seen FROM devices WHERE mac_address = ?", (device_data.get('mac_address'),))
-        existing = cursor.fetchone()
+    @staticmethod
+    def _previous_state(cursor, macs, macless_ips, source=''):
+        """Stored (id, ip_address, last_seen) of devices by MAC address, or by IP address for MAC-less ones of source"""
+        state = {}
+        queries = (
+            ("SELECT mac_address, id, ip_address, last_seen FROM devices WHERE mac_address IN ({})", macs, []),
+            ("SELECT ip_address, id, ip_address, last_seen FROM devices "
+             "WHERE mac_address IS NULL AND source = ? AND ip_address IN ({})", macless_ips, [source]),
+        )
+        for query, keys, params in queries:
+            for start in range(0, len(keys), Device.LOOKUP_CHUNK):
+                chunk = keys[start:start + Device.LOOKUP_CHUNK]
+                cursor.execute(query.format(', '.join('?' * len(chunk))), params + chunk)
+                state.update((key, rest) for key, *rest in cursor.fetchall())
+        return state
 
-        method = device_data.get('method')
+    @staticmethod
+    def _row(device_data, source=''):
+        """Parameters of UPSERT_SQL for one device, without first_seen and last_seen"""
+        open_ports = device_data.get('open_ports', '[]')
+        if isinstance(open_ports, list):
+            open_ports = json.dumps(open_ports)
+        # Only overwrite stored IPv6 addresses when this scan saw some
+        ipv6_addresses = json.dumps(device_data['ipv6_addresses']) if device_data.get('ipv6_addresses') else None
+        # Scans without the fingerprint stage keep the stored services
+        services = json.dumps(device_data['services']) if device_data.get('services') is not None else None
+        return (
+            device_data.get('ip_address'),
+            Device.normalize_mac(device_data.get('mac_address')),
+            device_data.get('hostname'),
+            device_data.get('vendor'),
+            device_data.get('device_type', 'Unknown'),
+            open_ports,
+            device_data.get('method'),
+            device_data.get('hostname_checked_at'),
+            device_data.get('ports_checked_at'),
+            ipv6_addresses,
+            services,
+            source
+        )
 
-        if existing:
-            # Update existing device, preserve first_seen
+    @staticmethod
+    def mark_seen(sightings, source=''):
+        """Refresh last_seen of unchanged devices from (mac_address, ip_address) pairs reported by source.
+
+        Returns the pairs (as given) that match no stored device.
+        """
+        macs = [Device.normalize_mac(mac) for mac, _ in sightings]
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
+            previous = Device._previous_state(cursor, [mac for mac in macs if mac],
+                                              [ip for mac, (_, ip) in zip(macs, sightings) if not mac], source)
+            updated = []
+            unknown = []
+            for mac, (given_mac, ip) in zip(macs, sightings):
+                if mac:
+                    cursor.execute("""
+                        UPDATE devices SET last_seen = CURRENT_TIMESTAMP, is_active = 1, ip_address = ?, source = ?
+                        WHERE mac_address = ?
+                    """, (ip, source, mac))
+                else:
+                    cursor.execute("""
+                        UPDATE devices SET last_seen = CURRENT_TIMESTAMP, is_active = 1
+                        WHERE ip_address = ? AND mac_address IS NULL AND source = ?
+                    """, (ip, source))
+                if not cursor.rowcount:
+                    unknown.append((given_mac, ip))
+                elif (mac or ip) in previous:
+                    device_id, previous_ip, previous_seen = previous[mac or ip]
+                    updated.append((device_id, ip, None, previous_ip, previous_seen))
+            DeviceHistory.record(cursor, updated)
+            Stats.record_changes(cursor, seen_ids=[sighting[0] for sighting in updated])
+        return unknown
+
+    @staticmethod
+    def record_sighting(device_data):
+        """Insert or refresh a passively seen device, keeping the fields only a scan fills in.
+
+        Returns the stored mac_address, hostname, vendor, device_type and last_seen after the merge.
+        """
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
+            mac = Device.normalize_mac(device_data.get('mac_address'))
+            previous = Device._previous_state(cursor, [mac], [])
+            hostname = device_data.get('hostname')
             cursor.execute("""
                 UPDATE devices SET
                     ip_address = ?,
-                    hostname = ?,
-                    vendor = ?,
-                    device_type = ?,
+                    hostname = COALESCE(?, hostname),
+                    hostname_checked_at = CASE WHEN ? IS NULL THEN hostname_checked_at ELSE CURRENT_TIMESTAMP END,
+                    vendor = COALESCE(vendor, ?),
+                    device_type = CASE WHEN device_type IS NULL OR device_type = 'Unknown' THEN ? ELSE device_type END,
                     last_seen = CURRENT_TIMESTAMP,
                     is_active = 1,
-                    open_ports = ?,
                     method = ?
                 WHERE mac_address = ?
             """, (
                 device_data.get('ip_address'),
-                device_data.get('hostname'),
+                hostname,
+                hostname,
                 device_data.get('vendor'),
                 device_data.get('device_type', 'Unknown'),
-                device_data.get('open_ports', '[]'),
-                method,
-                device_data.get('mac_address')
+                device_data.get('method'),
+                mac
             ))
-            device_id = existing[0]
-        else:
-            # Insert new device, set both first_seen and last_seen to now
+            if cursor.rowcount == 0:
+                cursor.execute("""
+                    INSERT INTO devices (
+                        ip_address, mac_address, hostname, vendor, device_type, open_ports,
+                        first_seen, last_seen, method, hostname_checked_at
+                    ) VALUES (?, ?, ?, ?, ?, '[]', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?,
+                              CASE WHEN ? IS NULL THEN NULL ELSE CURRENT_TIMESTAMP END)
+                """, (
+                    device_data.get('ip_address'),
+                    mac,
+                    hostname,
+                    device_data.get('vendor'),
+                    device_data.get('device_type', 'Unknown'),
+                    device_data.get('method'),
+                    hostname
+                ))
             cursor.execute("""
-                INSERT INTO devices (
-                    ip_address, mac_address, hostname, vendor,
-                    device_type, open_ports, first_seen, last_seen, method
-                ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?)
-            """, (
-                device_data.get('ip_address'),
-                device_data.get('mac_address'),
-                device_data.get('hostname'),
-                device_data.get('vendor'),
-                device_data.get('device_type', 'Unknown'),
-                device_data.get('open_ports', '[]'),
-                method
-            ))
-            device_id = cursor.lastrowid
-
-        conn.commit()
-        conn.close()
-        return device_id
+                SELECT id, mac_address, hostname, vendor, device_type, last_seen FROM devices WHERE mac_address = ?
+            """, (mac,))
+            device_id, *fields = cursor.fetchone()
+            stored = dict(zip(('mac_address', 'hostname', 'vendor', 'device_type', 'last_seen'), fields))
+            previous_ip, previous_seen = previous[mac][1:] if mac in previous else (None, None)
+            DeviceHistory.record(cursor, [(device_id, device_data.get('ip_address'), device_data.get('method'),
+                                           previous_ip, previous_seen)])
+            Stats.record_changes(cursor, inserted=0 if mac in previous else 1, seen_ids=[device_id])
+        return stored
 
     @staticmethod
     def mark_inactive(cutoff_hours=2):
         """Mark devices as inactive if not seen recently"""
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
 
-        cutoff_time = datetime.now() - timedelta(hours=cutoff_hours)
-        cursor.execute("""
-            UPDATE devices SET is_active = 0
-            WHERE last_seen < ? AND is_active = 1
-        """, (cutoff_time,))
+            cutoff_time = datetime.now() - timedelta(hours=cutoff_hours)
+            cursor.execute("SELECT id FROM devices WHERE last_seen < ? AND is_active = 1", (cutoff_time,))
+            ids = cursor.fetchall()
+            cursor.executemany("UPDATE devices SET is_active = 0 WHERE id = ?", ids)
+            Stats.record_changes(cursor, inactive_ids=[device_id for device_id, in ids])
+        return len(ids)
 
-        updated_count = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return updated_count
+    @staticmethod
+    def mark_ranges_inactive(networks, source=''):
+        """Mark the devices source reported inside the given ip_network objects as inactive"""
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute("SELECT id, ip_address FROM devices WHERE is_active = 1 AND source = ?", (source,))
+            ids = []
+            for device_id, ip in cursor.fetchall():
+                try:
+                    address = ipaddress.ip_address(ip)
+                except (TypeError, ValueError):
+                    continue
+                if any(address in network for network in networks):
+                    ids.append((device_id,))
+            cursor.executemany("UPDATE devices SET is_active = 0 WHERE id = ?", ids)
+            Stats.record_changes(cursor, inactive_ids=[device_id for device_id, in ids])
+        return len(ids)
+
+class DeviceHistory:
+    """Presence events of every device, rolled up into hourly and daily uptime.
+
+    device_history keeps the raw events: a device coming online after a
+    gap, or changing its IP address. Every sighting also adds to the
+    rollups in the same transaction. The time since the device's previous
+    sighting counts as online when it is at most HISTORY_GAP seconds.
+    Timelines are read from the rollups only, timestamps are UTC.
+    """
+
+    # Resolution -> (rollup table, bucket length in seconds)
+    ROLLUPS = {
+        'hour': ('device_presence_hourly', 3600),
+        'day': ('device_presence_daily', 86400),
+    }
+    EPOCH = datetime(1970, 1, 1)
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    @staticmethod
+    def utcnow():
+        """Current UTC time as a naive datetime, the way CURRENT_TIMESTAMP stores it"""
+        return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+    @staticmethod
+    def bucket_start(moment, size):
+        """Start of the size-second bucket holding a datetime"""
+        seconds = (moment - DeviceHistory.EPOCH).total_seconds()
+        return DeviceHistory.EPOCH + timedelta(seconds=seconds // size * size)
+
+    @staticmethod
+    def split(start, end, size):
+        """Split the interval [start, end) into (bucket_start, seconds) pieces"""
+        pieces = []
+        while start < end:
+            bucket = DeviceHistory.bucket_start(start, size)
+            piece_end = min(end, bucket + timedelta(seconds=size))
+            pieces.append((bucket, (piece_end - start).total_seconds()))
+            start = piece_end
+        return pieces
+
+    @staticmethod
+    def record(cursor, sightings, seen_at=None):
+        """Log a batch of sightings through the caller's cursor, inside its transaction.
+
+        sightings are (device_id, ip_address, method, previous_ip, previous_last_seen)
+        tuples, the previous values None for new devices.
+        """
+        if not sightings:
+            return
+        seen_at = seen_at or DeviceHistory.utcnow()
+        timestamp = seen_at.strftime(DeviceHistory.TIME_FORMAT)
+        events = []
+        rollups = {resolution: {} for resolution in DeviceHistory.ROLLUPS}  # (device_id, bucket) -> [online, sightings, ip_changes]
+
+        for device_id, ip, method, previous_ip, previous_seen in sightings:
+            try:
+                previous_seen = datetime.fromisoformat(previous_seen) if previous_seen else None
+            except (TypeError, ValueError):
+                previous_seen = None
+            if previous_seen is not None and 0 <= (seen_at - previous_seen).total_seconds() <= conf.HISTORY_GAP:
+                online_since = previous_seen
+            else:
+                online_since = seen_at
+                events.append((device_id, ip, timestamp, 'online', method))
+            ip_changed = previous_ip is not None and previous_ip != ip
+            if ip_changed:
+                events.append((device_id, ip, timestamp, 'ip_change', method))
+
+            for resolution, (_, size) in DeviceHistory.ROLLUPS.items():
+                buckets = rollups[resolution]
+                for bucket, seconds in DeviceHistory.split(online_since, seen_at, size):
+                    buckets.setdefault((device_id, bucket), [0, 0, 0])[0] += seconds
+                totals = buckets.setdefault((device_id, DeviceHistory.bucket_start(seen_at, size)), [0, 0, 0])
+                totals[1] += 1
+                totals[2] += ip_changed
+
+        cursor.executemany("""
+            INSERT INTO device_history (device_id, ip_address, timestamp, status, method)
+            VALUES (?, ?, ?, ?, ?)
+        """, events)
+        for resolution, (table, _) in DeviceHistory.ROLLUPS.items():
+            cursor.executemany(f"""
+                INSERT INTO {table} (device_id, bucket_start, online_seconds, sightings, ip_changes)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (device_id, bucket_start) DO UPDATE SET
+                    online_seconds = online_seconds + excluded.online_seconds,
+                    sightings = sightings + excluded.sightings,
+                    ip_changes = ip_changes + excluded.ip_changes
+            """, [
+                (device_id, bucket.strftime(DeviceHistory.TIME_FORMAT), *totals)
+                for (device_id, bucket), totals in rollups[resolution].items()
+            ])
+
+    @staticmethod
+    def timeline(mac_address, resolution='hour', start=None, end=None):
+        """Uptime of one device per bucket between start and end, None for an unknown device.
+
+        Buckets without a sighting are included with zero uptime; the
+        current bucket's uptime is relative to the part that has passed.
+        """
+        table, size = DeviceHistory.ROLLUPS[resolution]
+        now = DeviceHistory.utcnow()
+        end = end or now
+        start = DeviceHistory.bucket_start(start or end - timedelta(seconds=size * 24), size)
+
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM devices WHERE mac_address = ?", (Device.normalize_mac(mac_address),))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(f"""
+                SELECT bucket_start, online_seconds, sightings, ip_changes
+                FROM {table}
+                WHERE device_id = ? AND bucket_start >= ? AND bucket_start < ?
+            """, (row[0], start.strftime(DeviceHistory.TIME_FORMAT), end.strftime(DeviceHistory.TIME_FORMAT)))
+            rollup = {bucket: values for bucket, *values in cursor.fetchall()}
+
+        buckets = []
+        online_total = elapsed_total = 0
+        bucket = start
+        while bucket < end:
+            online, sightings, ip_changes = rollup.get(bucket.strftime(DeviceHistory.TIME_FORMAT), (0, 0, 0))
+            elapsed = min(size, max(0, (now - bucket).total_seconds()))
+            buckets.append({
+                'start': bucket.strftime(DeviceHistory.TIME_FORMAT),
+                'online_seconds': round(online, 1),
+                'uptime': round(min(1.0, online / elapsed), 4) if elapsed else 0.0,
+                'sightings': sightings,
+                'ip_changes': ip_changes
+            })
+            online_total += online
+            elapsed_total += elapsed
+            bucket += timedelta(seconds=size)
+
+        return {
+            'device_id': row[0],
+            'resolution': resolution,
+            'buckets': buckets,
+            'online_seconds': round(online_total, 1),
+            'uptime': round(min(1.0, online_total / elapsed_total), 4) if elapsed_total else 0.0
+        }
+
+    @staticmethod
+    def prune(now=None):
+        """Delete raw events and rollups past their retention, returns the rows deleted per table"""
+        now = now or DeviceHistory.utcnow()
+        retention = {
+            'device_history': ('timestamp', conf.HISTORY_RETENTION_DAYS),
+            'device_presence_hourly': ('bucket_start', conf.HISTORY_HOURLY_RETENTION_DAYS),
+            'device_presence_daily': ('bucket_start', conf.HISTORY_DAILY_RETENTION_DAYS),
+        }
+        deleted = {}
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
+            for table, (column, days) in retention.items():
+                if not days:  # kept forever
+                    continue
+                cutoff = (now - timedelta(days=days)).strftime(DeviceHistory.TIME_FORMAT)
+                cursor.execute(f"DELETE FROM {table} WHERE {column} < ?", (cutoff,))
+                deleted[table] = cursor.rowcount
+        return deleted
 
 class NetworkScan:
     @staticmethod
     def log_scan(devices_found, duration, method):
         """Log a network scan"""
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            INSERT INTO network_scans (devices_found, scan_duration, scan_method)
-            VALUES (?, ?, ?)
-        """, (devices_found, duration, method))
+        with DatabaseManager.writer() as conn:
+            cursor = conn.cursor()
 
-        conn.commit()
-        conn.close()
+            cursor.execute("""
+                INSERT INTO network_scans (devices_found, scan_duration, scan_method)
+                VALUES (?, ?, ?)
+            """, (devices_found, duration, method))
+            cursor.execute("SELECT scan_time FROM network_scans WHERE id = ?", (cursor.lastrowid,))
+            Stats.record_changes(cursor, scan_time=cursor.fetchone()[0])
 
     @staticmethod
     def get_recent_scans(limit=10):
         """Get recent scan history"""
-        conn = DatabaseManager.get_connection()
-        conn.row_factory = DatabaseManager.dict_factory
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT * FROM network_scans
-            ORDER BY scan_time DESC
-            LIMIT ?
-        """, (limit,))
-
-        scans = cursor.fetchall()
-        conn.close()
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = DatabaseManager.dict_factory
+
+            cursor.execute("""
+                SELECT * FROM network_scans
+                ORDER BY scan_time DESC
+                LIMIT ?
+            """, (limit,))
+
+            scans = cursor.fetchall()
         return scans
 
-class Stats:
+class Settings:
     @staticmethod
-    def get_dashboard_stats():
-        """Get statistics for dashboard"""
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
+    def get(name, default=None):
+        """Get a setting value from the settings table"""
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
 
-        # Total devices
-        cursor.execute("SELECT COUNT(*) FROM devices")
-        total_devices = cursor.fetchone()[0]
+            cursor.execute("SELECT setting_value FROM settings WHERE setting_name = ?", (name,))
+            row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else default
 
-        # Active devices (last hour)
-        hour_ago = datetime.now() - timedelta(hours=1)
-        cursor.execute("SELECT COUNT(*) FROM devices WHERE last_seen > ? AND is_active = 1", (hour_ago,))
-        active_devices = cursor.fetchone()[0]
+class Stats:
+    """Dashboard counters served from memory.
 
-        # New devices today
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        cursor.execute("SELECT COUNT(*) FROM devices WHERE first_seen > ?", (today,))
-        new_today = cursor.fetchone()[0]
+    Writers add their changes to the dashboard_stats table inside their own
+    transaction (see record_changes) and to the in-memory counters once it
+    commits. get_dashboard_stats is a lookup, and a restart reloads the
+    persisted counters. Active devices are a sliding window over last_seen,
+    so they are kept as device ids ordered by last sighting and reloaded
+    from the (is_active, last_seen) index rather than persisted.
+    check_consistency compares the counters with full_dashboard_stats.
+    """
 
-        # Last scan time
-        cursor.execute("SELECT scan_time FROM network_scans ORDER BY scan_time DESC LIMIT 1")
-        last_scan_result = cursor.fetchone()
-        last_scan = last_scan_result[0] if last_scan_result else None
+    ACTIVE_WINDOW = timedelta(hours=1)
+    _counters = {}  # database path -> counters of that database
+    _lock = threading.Lock()
 
-        conn.close()
+    @staticmethod
+    def day_start():
+        """UTC time of the last local midnight, where new_today starts counting"""
+        midnight = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def full_dashboard_stats(now=None):
+        """Compute the dashboard statistics from the devices and network_scans tables"""
+        now = now or DeviceHistory.utcnow()
+        with DatabaseManager.reader() as conn:
+            cursor = conn.cursor()
+
+            # Total devices
+            cursor.execute("SELECT COUNT(*) FROM devices")
+            total_devices = cursor.fetchone()[0]
+
+            # Active devices (last hour)
+            hour_ago = (now - Stats.ACTIVE_WINDOW).strftime(DeviceHistory.TIME_FORMAT)
+            cursor.execute("SELECT COUNT(*) FROM devices WHERE last_seen > ? AND is_active = 1", (hour_ago,))
+            active_devices = cursor.fetchone()[0]
+
+            # New devices today
+            today = Stats.day_start().strftime(DeviceHistory.TIME_FORMAT)
+            cursor.execute("SELECT COUNT(*) FROM devices WHERE first_seen >= ?", (today,))
+            new_today = cursor.fetchone()[0]
+
+            # Last scan time
+            cursor.execute("SELECT scan_time FROM network_scans ORDER BY scan_time DESC LIMIT 1")
+            last_scan_result = cursor.fetchone()
+            last_scan = last_scan_result[0] if last_scan_result else None
 
         return {
             'total_devices': total_devices,
@@ -275,3 +771,121 @@ class Stats:
             'new_today': new_today,
             'last_scan': last_scan
         }
+
+    @staticmethod
+    def _load(path):
+        """Counters of a database from dashboard_stats, rebuilt with full queries when it has none"""
+        with DatabaseManager._write_lock:  # no writer commits while the counters are read
+            now = DeviceHistory.utcnow()
+            with DatabaseManager.reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name, value, period_start FROM dashboard_stats")
+                stored = {name: (value, period_start) for name, value, period_start in cursor.fetchall()}
+                cursor.execute("""
+                    SELECT id, last_seen FROM devices
+                    WHERE is_active = 1 AND last_seen > ?
+                    ORDER BY last_seen
+                """, ((now - Stats.ACTIVE_WINDOW).strftime(DeviceHistory.TIME_FORMAT),))
+                active = OrderedDict((device_id, datetime.fromisoformat(last_seen))
+                                     for device_id, last_seen in cursor.fetchall())
+
+            if 'total_devices' not in stored:
+                full = Stats.full_dashboard_stats(now)
+                stored = {
+                    'total_devices': (full['total_devices'], None),
+                    'new_today': (full['new_today'], Stats.day_start().strftime(DeviceHistory.TIME_FORMAT)),
+                    'last_scan': (full['last_scan'], None),
+                }
+                with DatabaseManager.writer() as conn:
+                    conn.execute("DELETE FROM dashboard_stats")
+                    conn.executemany("INSERT INTO dashboard_stats (name, value, period_start) VALUES (?, ?, ?)",
+                                     [(name, value, period) for name, (value, period) in stored.items()])
+
+            counters = {
+                'total_devices': stored['total_devices'][0],
+                'new_today': stored['new_today'][0],
+                'period_start': stored['new_today'][1],
+                'last_scan': stored['last_scan'][0],
+                'active': active
+            }
+            with Stats._lock:
+                Stats._counters[path] = counters
+            return counters
+
+    @staticmethod
+    def _current():
+        path = current_app.config['DATABASE_PATH']
+        with Stats._lock:
+            counters = Stats._counters.get(path)
+        return counters if counters is not None else Stats._load(path)
+
+    @staticmethod
+    def record_changes(cursor, inserted=0, seen_ids=(), inactive_ids=(), scan_time=None, seen_at=None):
+        """Add a writer's changes to dashboard_stats through its cursor, and to memory once it commits"""
+        counters = Stats._current()
+        period = Stats.day_start().strftime(DeviceHistory.TIME_FORMAT)
+        if inserted:
+            cursor.execute("UPDATE dashboard_stats SET value = value + ? WHERE name = 'total_devices'", (inserted,))
+            cursor.execute("""
+                UPDATE dashboard_stats
+                SET value = CASE WHEN period_start = ? THEN value + ? ELSE ? END, period_start = ?
+                WHERE name = 'new_today'
+            """, (period, inserted, inserted, period))
+        if scan_time:
+            cursor.execute("""
+                UPDATE dashboard_stats SET value = CASE WHEN value IS NULL OR value < ? THEN ? ELSE value END
+                WHERE name = 'last_scan'
+            """, (scan_time, scan_time))
+        seen_at = seen_at or DeviceHistory.utcnow()
+
+        def apply():
+            with Stats._lock:
+                counters['total_devices'] += inserted
+                if counters['period_start'] != period:
+                    counters['new_today'], counters['period_start'] = 0, period
+                counters['new_today'] += inserted
+                if scan_time and (counters['last_scan'] is None or counters['last_scan'] < scan_time):
+                    counters['last_scan'] = scan_time
+                active = counters['active']
+                for device_id in inactive_ids:
+                    active.pop(device_id, None)
+                for device_id in seen_ids:
+                    active[device_id] = seen_at
+                    active.move_to_end(device_id)
+
+        DatabaseManager.on_commit(apply)
+
+    @staticmethod
+    def get_dashboard_stats(now=None):
+        """Get statistics for dashboard"""
+        counters = Stats._current()
+        now = now or DeviceHistory.utcnow()
+        period = Stats.day_start().strftime(DeviceHistory.TIME_FORMAT)
+        with Stats._lock:
+            # Devices drop out of the active window oldest first
+            active = counters['active']
+            while active and next(iter(active.values())) <= now - Stats.ACTIVE_WINDOW:
+                active.popitem(last=False)
+            return {
+                'total_devices': counters['total_devices'],
+                'active_devices': len(active),
+                'new_today': counters['new_today'] if counters['period_start'] == period else 0,
+                'last_scan': counters['last_scan']
+            }
+
+    @staticmethod
+    def check_consistency():
+        """Compare the counters with the full queries and rebuild them on a mismatch.
+
+        Returns {name: (counter, actual)} for every counter that was off.
+        """
+        with DatabaseManager._write_lock:
+            now = DeviceHistory.utcnow()
+            counted = Stats.get_dashboard_stats(now)
+            actual = Stats.full_dashboard_stats(now)
+            mismatches = {name: (counted[name], actual[name]) for name in actual if counted[name] != actual[name]}
+            if mismatches:
+                with DatabaseManager.writer() as conn:
+                    conn.execute("DELETE FROM dashboard_stats")
+                Stats._load(current_app.config['DATABASE_PATH'])
+        return mismatches
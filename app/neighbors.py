@@ -0,0 +1,152 @@
+import os
+import socket
+import struct
+import threading
+import time
+
+# this file reads the kernel neighbor (ARP/NDP) table without spawning processes
+
+PROC_NET_ARP = '/proc/net/arp'
+
+# rtnetlink constants (linux/netlink.h, linux/rtnetlink.h, linux/neighbour.h)
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+NDA_DST = 1
+NDA_LLADDR = 2
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40  # multicast/broadcast mappings, not real neighbors
+
+ATF_COM = 0x02  # completed ARP entry
+EMPTY_MAC = '00:00:00:00:00:00'
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_NDMSG = struct.Struct('=BBHiHBB')
+_RTATTR = struct.Struct('=HH')
+
+
+def _format_mac(raw):
+    return ':'.join(f'{b:02x}' for b in raw)
+
+
+def read_proc_arp(path=PROC_NET_ARP):
+    """Parse /proc/net/arp into {ip: mac}"""
+    table = {}
+    with open(path, 'r') as f:
+        next(f, None)  # header
+        for line in f:
+            fields = line.split()
+            if len(fields) < 6:
+                continue
+            ip, _, flags, mac = fields[:4]
+            if int(flags, 16) & ATF_COM and mac != EMPTY_MAC:
+                table[ip] = mac.lower()
+    return table
+
+
+def read_netlink_neighbors(family=socket.AF_INET, timeout=2):
+    """Dump the kernel neighbor table over rtnetlink into {ip: mac}"""
+    table = {}
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.settimeout(timeout)
+        sock.bind((0, 0))
+        seq = int(time.time()) & 0xFFFFFFFF
+        body = _NDMSG.pack(family, 0, 0, 0, 0, 0, 0)
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(body), RTM_GETNEIGH,
+                                NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+        sock.send(header + body)
+
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                msg_len, msg_type, _, msg_seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                if msg_len < _NLMSGHDR.size:
+                    return table
+                if msg_seq == seq:
+                    if msg_type == NLMSG_DONE:
+                        return table
+                    if msg_type == NLMSG_ERROR:
+                        raise OSError('netlink neighbor dump failed')
+                    if msg_type == RTM_NEWNEIGH:
+                        entry = _parse_neighbor(data, offset + _NLMSGHDR.size, offset + msg_len)
+                        if entry:
+                            table[entry[0]] = entry[1]
+                offset += (msg_len + 3) & ~3
+    finally:
+        sock.close()
+
+
+def _parse_neighbor(data, start, end):
+    """Parse one RTM_NEWNEIGH payload into (ip, mac) or None"""
+    family, _, _, _, state, _, _ = _NDMSG.unpack_from(data, start)
+    if state & (NUD_INCOMPLETE | NUD_FAILED | NUD_NOARP):
+        return None
+    dst = lladdr = None
+    offset = start + _NDMSG.size
+    while offset + _RTATTR.size <= end:
+        attr_len, attr_type = _RTATTR.unpack_from(data, offset)
+        if attr_len < _RTATTR.size:
+            break
+        value = data[offset + _RTATTR.size:offset + attr_len]
+        if attr_type == NDA_DST:
+            dst = socket.inet_ntop(family, value)
+        elif attr_type == NDA_LLADDR and len(value) == 6:
+            lladdr = _format_mac(value)
+        offset += (attr_len + 3) & ~3
+    if dst and lladdr and lladdr != EMPTY_MAC:
+        return dst, lladdr
+    return None
+
+
+def read_neighbor_table(family=socket.AF_INET):
+    """Read the neighbor table from the kernel, or None when that is not possible here"""
+    if hasattr(socket, 'AF_NETLINK'):
+        try:
+            return read_netlink_neighbors(family)
+        except OSError:
+            pass
+    if family == socket.AF_INET and os.path.exists(PROC_NET_ARP):
+        try:
+            return read_proc_arp()
+        except OSError:
+            pass
+    return None
+
+
+class NeighborTable:
+    """Snapshot of the IPv4 neighbor table, reloaded at most every min_refresh seconds on a miss"""
+
+    def __init__(self, min_refresh=1.0, reader=read_neighbor_table):
+        self.min_refresh = min_refresh
+        self.reader = reader
+        self.entries = {}
+        self.supported = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Reload the table, returns False when the kernel table is not readable"""
+        table = self.reader()
+        with self._lock:
+            self.supported = table is not None
+            self.entries = table or {}
+            self._loaded_at = time.monotonic()
+        return self.supported
+
+    def get(self, ip):
+        """Return the MAC for an IP, reloading once if the entry is missing"""
+        if self.supported is None:
+            self.refresh()
+        mac = self.entries.get(ip)
+        if mac is None and self.supported and time.monotonic() - self._loaded_at >= self.min_refresh:
+            # A host that just answered a ping has a fresh entry the snapshot predates
+            self.refresh()
+            mac = self.entries.get(ip)
+        return mac
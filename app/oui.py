@@ -0,0 +1,141 @@
+import csv
+import os
+import re
+import threading
+
+from config import Config as conf
+
+# this file maps MAC prefixes to vendors from a local IEEE registry file
+
+# mac-vendor-lookup keeps its download here in the same "PREFIX:Vendor" format
+MAC_VENDOR_LOOKUP_CACHE = os.path.expanduser('~/.cache/mac-vendors.txt')
+
+# Registry block sizes in bits, longest first so MA-S beats MA-M beats MA-L
+PREFIX_BITS = {'MA-S': 36, 'MA-M': 28, 'MA-L': 24}
+
+_HEX_DIGITS = re.compile(r'[^0-9a-fA-F]')
+_OUI_TXT_LINE = re.compile(r'^\s*([0-9A-Fa-f]{2}-[0-9A-Fa-f]{2}-[0-9A-Fa-f]{2})\s+\(hex\)\s+(.+?)\s*$')
+
+
+class OUIIndex:
+    """In-memory prefix table covering the MA-L, MA-M and MA-S registries"""
+
+    def __init__(self, memo_size=65536):
+        self._tables = {bits: {} for bits in sorted(PREFIX_BITS.values(), reverse=True)}
+        self._memo = {}
+        self._memo_size = memo_size
+
+    def __len__(self):
+        return sum(len(table) for table in self._tables.values())
+
+    def add(self, prefix, vendor):
+        """Add a hex prefix of 6 (MA-L), 7 (MA-M) or 9 (MA-S) digits"""
+        prefix = _HEX_DIGITS.sub('', prefix)
+        bits = len(prefix) * 4
+        if bits not in self._tables or not vendor:
+            return False
+        self._tables[bits][int(prefix, 16)] = vendor.strip()
+        self._memo.clear()
+        return True
+
+    def load(self, path):
+        """Load a registry file, returns the number of prefixes read.
+
+        Understands the compact "PREFIX:Vendor" format written by
+        scripts/update_oui.py, the IEEE CSV exports (oui.csv, mam.csv,
+        oui36.csv) and the IEEE oui.txt listing.
+        """
+        count = 0
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            first_line = f.readline()
+            f.seek(0)
+            if first_line.startswith('Registry,'):
+                for row in csv.DictReader(f):
+                    if row.get('Registry') in PREFIX_BITS:
+                        count += self.add(row.get('Assignment', ''), row.get('Organization Name', ''))
+                return count
+
+            for line in f:
+                match = _OUI_TXT_LINE.match(line)
+                if match:
+                    count += self.add(match.group(1), match.group(2))
+                elif ':' in line and not line.startswith('#'):
+                    prefix, vendor = line.split(':', 1)
+                    count += self.add(prefix, vendor)
+        return count
+
+    def save(self, path):
+        """Write the index in the compact "PREFIX:Vendor" format"""
+        tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for bits, table in self._tables.items():
+                digits = bits // 4
+                for prefix, vendor in sorted(table.items()):
+                    f.write(f"{prefix:0{digits}X}:{vendor}\n")
+        os.replace(tmp_path, path)
+
+    def replace(self, other):
+        """Take over the prefixes of another index"""
+        self._tables, self._memo = other._tables, {}
+
+    def lookup(self, mac):
+        """Return the vendor for a MAC address, or None"""
+        if not mac:
+            return None
+        try:
+            return self._memo[mac]
+        except KeyError:
+            pass
+
+        digits = _HEX_DIGITS.sub('', mac)
+        vendor = None
+        if len(digits) == 12:
+            value = int(digits, 16)
+            for bits, table in self._tables.items():
+                vendor = table.get(value >> (48 - bits))
+                if vendor:
+                    break
+
+        if len(self._memo) >= self._memo_size:
+            self._memo.clear()
+        self._memo[mac] = vendor
+        return vendor
+
+
+_index = None
+_index_source = None  # (path, mtime) of the file the shared index was loaded from
+_index_lock = threading.Lock()
+
+
+def _oui_source():
+    """(path, mtime) of the registry file to load, None when there is none"""
+    for path in (conf.OUI_FILE, MAC_VENDOR_LOOKUP_CACHE):
+        try:
+            return path, os.path.getmtime(path)
+        except (OSError, TypeError):
+            continue
+    return None
+
+
+def get_oui_index():
+    """Return the shared index, reloading it when scripts/update_oui.py replaces the file"""
+    global _index, _index_source
+    source = _oui_source()
+    with _index_lock:
+        if _index is None or source != _index_source:
+            index = OUIIndex()
+            if source is None:
+                print("Warning: no OUI file found, vendor lookup disabled. Run scripts/update_oui.py")
+            else:
+                try:
+                    index.load(source[0])
+                except OSError as e:
+                    print(f"Could not load OUI file {source[0]}: {e}")
+            if _index is None:
+                _index = index
+            else:
+                # Update the shared index in place, passive discovery keeps a reference to it
+                _index.replace(index)
+            _index_source = source
+        return _index
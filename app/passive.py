@@ -0,0 +1,323 @@
+import argparse
+import ipaddress
+import socket
+import struct
+import time
+
+from config import Config as conf
+
+# this file learns devices passively from ARP, DHCP, mDNS and SSDP traffic
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_8021Q = 0x8100
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+
+DHCP_PORTS = (67, 68)
+MDNS_PORT = 5353
+SSDP_PORT = 1900
+
+DHCP_MAGIC = b'\x63\x82\x53\x63'
+DHCP_OPT_HOSTNAME = 12
+DHCP_OPT_REQUESTED_IP = 50
+DHCP_OPT_END = 255
+DNS_TYPE_A = 1
+
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': '<',  # microsecond timestamps
+    b'\xa1\xb2\xc3\xd4': '>',
+    b'\x4d\x3c\xb2\xa1': '<',  # nanosecond timestamps
+    b'\xa1\xb2\x3c\x4d': '>',
+}
+
+
+def _mac(raw):
+    return ':'.join(f'{b:02x}' for b in raw)
+
+
+def _usable_ip(ip):
+    address = ipaddress.IPv4Address(ip)
+    return not (address.is_unspecified or address.is_multicast or address.is_loopback
+                or ip == '255.255.255.255')
+
+
+def decode_frame(frame):
+    """Decode one Ethernet frame into a list of observations.
+
+    Each observation is a dict with ip, mac, hostname (or None) and the
+    method that produced it (arp, dhcp, mdns or ssdp).
+    """
+    try:
+        if len(frame) < 14:
+            return []
+        src_mac = _mac(frame[6:12])
+        ethertype, offset = struct.unpack_from('!H', frame, 12)[0], 14
+        if ethertype == ETH_P_8021Q:
+            ethertype, offset = struct.unpack_from('!H', frame, 16)[0], 18
+        if ethertype == ETH_P_ARP:
+            return _decode_arp(frame[offset:])
+        if ethertype == ETH_P_IP:
+            return _decode_ipv4(frame[offset:], src_mac)
+    except (struct.error, IndexError, ValueError, UnicodeDecodeError):
+        pass
+    return []
+
+
+def _decode_arp(packet):
+    htype, ptype, hlen, plen, _ = struct.unpack_from('!HHBBH', packet)
+    if htype != 1 or ptype != ETH_P_IP or hlen != 6 or plen != 4:
+        return []
+    sender_mac = _mac(packet[8:14])
+    sender_ip = socket.inet_ntoa(packet[14:18])
+    # ARP probes announce 0.0.0.0 while checking an address is free
+    if not _usable_ip(sender_ip):
+        return []
+    return [{'ip': sender_ip, 'mac': sender_mac, 'hostname': None, 'method': 'arp'}]
+
+
+def _decode_ipv4(packet, src_mac):
+    header_len = (packet[0] & 0x0F) * 4
+    if packet[0] >> 4 != 4 or packet[9] != socket.IPPROTO_UDP:
+        return []
+    src_ip = socket.inet_ntoa(packet[12:16])
+    src_port, dst_port = struct.unpack_from('!HH', packet, header_len)
+    payload = packet[header_len + 8:]
+
+    if src_port in DHCP_PORTS and dst_port in DHCP_PORTS:
+        return _decode_dhcp(payload)
+    if src_port == MDNS_PORT or dst_port == MDNS_PORT:
+        return _decode_mdns(payload, src_ip, src_mac)
+    if (src_port == SSDP_PORT or dst_port == SSDP_PORT) and _usable_ip(src_ip):
+        return [{'ip': src_ip, 'mac': src_mac, 'hostname': None, 'method': 'ssdp'}]
+    return []
+
+
+def _decode_dhcp(payload):
+    if len(payload) < 240 or payload[236:240] != DHCP_MAGIC:
+        return []
+    ciaddr = socket.inet_ntoa(payload[12:16])
+    yiaddr = socket.inet_ntoa(payload[16:20])
+    client_mac = _mac(payload[28:34])
+
+    options = {}
+    offset = 240
+    while offset < len(payload):
+        code = payload[offset]
+        if code == DHCP_OPT_END:
+            break
+        if code == 0:  # pad
+            offset += 1
+            continue
+        length = payload[offset + 1]
+        options[code] = payload[offset + 2:offset + 2 + length]
+        offset += 2 + length
+
+    hostname = options.get(DHCP_OPT_HOSTNAME, b'').decode('utf-8', 'replace').strip('\x00 ') or None
+    ip = None
+    for candidate in (yiaddr, ciaddr):
+        if _usable_ip(candidate):
+            ip = candidate
+            break
+    if ip is None and len(options.get(DHCP_OPT_REQUESTED_IP, b'')) == 4:
+        ip = socket.inet_ntoa(options[DHCP_OPT_REQUESTED_IP])
+    if ip is None and hostname is None:
+        return []
+    # A DISCOVER carries the hostname before the client has an address
+    return [{'ip': ip, 'mac': client_mac, 'hostname': hostname, 'method': 'dhcp'}]
+
+
+def _read_dns_name(message, offset):
+    """Read a possibly compressed DNS name, returns (name, offset after it)"""
+    labels = []
+    end = None
+    for _ in range(128):  # guards against pointer loops
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(message[offset:offset + length].decode('utf-8', 'replace'))
+        offset += length
+    return '.'.join(labels), end if end is not None else offset
+
+
+def _decode_mdns(message, src_ip, src_mac):
+    if not _usable_ip(src_ip):
+        return []
+    _, flags, qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHHHH', message)
+    hostname = None
+    if flags & 0x8000:  # responses announce "<host>.local" A records
+        offset = 12
+        for _ in range(qdcount):
+            _, offset = _read_dns_name(message, offset)
+            offset += 4
+        for _ in range(ancount + nscount + arcount):
+            name, offset = _read_dns_name(message, offset)
+            rtype, _, _, rdlength = struct.unpack_from('!HHIH', message, offset)
+            offset += 10
+            rdata = message[offset:offset + rdlength]
+            offset += rdlength
+            if rtype == DNS_TYPE_A and rdlength == 4 and socket.inet_ntoa(rdata) == src_ip:
+                hostname = name[:-len('.local')] if name.endswith('.local') else name
+                break
+    return [{'ip': src_ip, 'mac': src_mac, 'hostname': hostname, 'method': 'mdns'}]
+
+
+class PcapSource:
+    """Frames from a classic libpcap file, for replaying captures"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            header = f.read(24)
+            if len(header) < 24 or header[:4] not in _PCAP_MAGIC:
+                raise ValueError(f"{self.path} is not a pcap file (pcapng is not supported)")
+            order = _PCAP_MAGIC[header[:4]]
+            linktype = struct.unpack(f'{order}I', header[20:24])[0] & 0x0FFFFFFF
+            if linktype not in (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL):
+                raise ValueError(f"Unsupported pcap link type {linktype}")
+            record = struct.Struct(f'{order}IIII')
+            while True:
+                data = f.read(record.size)
+                if len(data) < record.size:
+                    return
+                _, _, captured, _ = record.unpack(data)
+                frame = f.read(captured)
+                if linktype == LINKTYPE_LINUX_SLL:
+                    frame = _sll_to_ethernet(frame)
+                if frame:
+                    yield frame
+
+
+def _sll_to_ethernet(frame):
+    """Rewrite a Linux cooked capture header as an Ethernet header"""
+    if len(frame) < 16:
+        return None
+    address_len = struct.unpack_from('!H', frame, 4)[0]
+    src_mac = frame[6:6 + min(address_len, 6)].ljust(6, b'\x00')
+    return b'\x00' * 6 + src_mac + frame[14:16] + frame[16:]
+
+
+class LiveSource:
+    """Frames captured from an interface with an AF_PACKET socket (Linux, needs CAP_NET_RAW)"""
+
+    def __init__(self, interface, timeout=1):
+        self.interface = interface
+        self.timeout = timeout
+        self.running = True
+
+    def __iter__(self):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            sock.bind((self.interface, 0))
+            sock.settimeout(self.timeout)
+            while self.running:
+                try:
+                    yield sock.recv(65535)
+                except socket.timeout:
+                    continue
+        finally:
+            sock.close()
+
+    def stop(self):
+        self.running = False
+
+
+class PassiveMonitor:
+    """Turns decoded observations into device records, one per MAC.
+
+    on_device(device_info) is called when a device is first seen, when its
+    IP or hostname changes, and otherwise at most every refresh_interval
+    seconds so last_seen stays current without a write per packet.
+    """
+
+    def __init__(self, on_device, refresh_interval=300, oui=None, classifier=None):
+        self.on_device = on_device
+        self.refresh_interval = refresh_interval
+        self.oui = oui
+        self.classifier = classifier
+        self.devices = {}  # mac -> last reported device_info
+        self._reported_at = {}
+        self._hostnames = {}  # mac -> hostname learned before the IP was known
+
+    def observe(self, observation, now=None):
+        """Merge one observation, returns the device_info if it was reported"""
+        now = time.time() if now is None else now
+        mac, ip, hostname = observation['mac'], observation['ip'], observation['hostname']
+        if hostname:
+            self._hostnames[mac] = hostname
+        if ip is None:
+            return None
+
+        previous = self.devices.get(mac)
+        hostname = hostname or self._hostnames.get(mac) or (previous or {}).get('hostname')
+        changed = previous is None or previous['ip'] != ip or previous['hostname'] != hostname
+        if not changed and now - self._reported_at.get(mac, 0) < self.refresh_interval:
+            return None
+
+        vendor = self.oui.lookup(mac) if self.oui else None
+        device_info = {
+            'ip': ip,
+            'mac': mac,
+            'hostname': hostname,
+            'vendor': vendor,
+            'device_type': self.classifier.classify(vendor, hostname, []) if self.classifier else 'Unknown',
+            'method': f"passive-{observation['method']}"
+        }
+        self.devices[mac] = device_info
+        self._reported_at[mac] = now
+        self.on_device(device_info)
+        return device_info
+
+    def run(self, source):
+        """Decode every frame of a source, returns the number of frames read"""
+        frames = 0
+        for frame in source:
+            frames += 1
+            for observation in decode_frame(frame):
+                self.observe(observation)
+        return frames
+
+
+def open_source(interface=None, pcap=None):
+    """Build the capture source for a live interface or a pcap file"""
+    if pcap:
+        return PcapSource(pcap)
+    if interface:
+        return LiveSource(interface)
+    raise ValueError('A capture interface or pcap file is required')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard Passive Discovery')
+    parser.add_argument('--interface', default=conf.PASSIVE_INTERFACE, help='Interface to capture on')
+    parser.add_argument('--pcap', default=None, help='Replay a pcap file instead of capturing')
+    args = parser.parse_args()
+
+    from app.classifier import get_classifier
+    from app.oui import get_oui_index
+    monitor = PassiveMonitor(
+        lambda device: print(f"{device['method']:<14} {device['ip']:<15} {device['mac']} "
+                             f"{device['hostname'] or '-'} ({device['device_type']})"),
+        refresh_interval=conf.PASSIVE_REFRESH_INTERVAL,
+        oui=get_oui_index(),
+        classifier=get_classifier()
+    )
+    try:
+        frames = monitor.run(open_source(args.interface, args.pcap))
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Passive discovery failed: {e}")
+    print(f"Read {frames} frames, learned {len(monitor.devices)} devices")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+import asyncio
+import math
+import os
+import platform
+import socket
+import struct
+import time
+
+from app.fingerprint import fingerprint_port
+from app.neighbors import read_neighbor_table
+from app.timing import probe_timeout
+
+# this file holds the asyncio probe engines used by the scanner
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+IPV6_ALL_NODES = 'ff02::1'
+
+_icmp_available = None
+
+
+def icmp_socket_available():
+    """Check (once) whether the kernel allows unprivileged ICMP datagram sockets"""
+    global _icmp_available
+    if _icmp_available is None:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            sock.close()
+            _icmp_available = True
+        except (OSError, AttributeError):
+            # Linux only allows this when the gid is inside net.ipv4.ping_group_range
+            _icmp_available = False
+    return _icmp_available
+
+
+def _checksum(data):
+    """Internet checksum (RFC 1071)"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(ident, seq):
+    """Build an ICMP echo request packet"""
+    payload = struct.pack('!d', time.monotonic())
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+async def _icmp_ping(ip, timeout, seq):
+    """Send one echo request over an ICMP datagram socket, return RTT in seconds or None"""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    try:
+        sock.setblocking(False)
+        sock.connect((ip, 0))
+        start = time.monotonic()
+        # The kernel rewrites the identifier on datagram sockets, so only the sequence is matched
+        await loop.sock_sendall(sock, _echo_request(os.getpid() & 0xFFFF, seq))
+        deadline = start + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            data = await asyncio.wait_for(loop.sock_recv(sock, 1024), remaining)
+            # BSD/macOS hand back the IP header as well, Linux does not
+            if len(data) >= 20 and data[0] >> 4 == 4:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, _, reply_seq = struct.unpack('!BBHHH', data[:8])
+            if icmp_type == ICMP_ECHO_REPLY and reply_seq == seq:
+                return time.monotonic() - start
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        sock.close()
+
+
+async def _subprocess_ping(ip, timeout):
+    """Ping through the system ping binary, return RTT in seconds or None
+
+    The reply wait flag only takes whole seconds on most Linux and BSD pings,
+    so the fractional timeout is enforced here by killing ping at the deadline.
+    """
+    system = platform.system().lower()
+    if system == 'windows':
+        cmd = ['ping', '-n', '1', '-w', str(max(1, int(timeout * 1000))), ip]
+    elif system == 'darwin':
+        # macOS takes -W in milliseconds
+        cmd = ['ping', '-n', '-c', '1', '-W', str(max(1, int(timeout * 1000))), ip]
+    else:
+        # Older iputils and BusyBox reject fractional -W
+        cmd = ['ping', '-n', '-c', '1', '-W', str(max(1, math.ceil(timeout))), ip]
+
+    start = time.monotonic()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return None
+    try:
+        returncode = await asyncio.wait_for(proc.wait(), timeout)
+    except asyncio.TimeoutError:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+        return None
+    if returncode != 0:
+        return None
+    return time.monotonic() - start
+
+
+async def ping_host(ip, timeout=1, seq=1):
+    """Ping a single host, return RTT in seconds or None if it did not answer"""
+    if icmp_socket_available():
+        return await _icmp_ping(ip, timeout, seq)
+    return await _subprocess_ping(ip, timeout)
+
+
+def _probe_interfaces():
+    """(name, index) of every non-loopback interface"""
+    try:
+        return [(name, index) for index, name in socket.if_nameindex() if name != 'lo']
+    except (OSError, AttributeError):
+        return []
+
+
+async def solicit_all_nodes(interfaces=None, timeout=1):
+    """Send one ICMPv6 echo request to ff02::1 on each interface.
+
+    Returns {address: interface} for the hosts that answered within timeout.
+    Answering hosts first resolve our address with a neighbor solicitation,
+    which also leaves them in the kernel's IPv6 neighbor cache.
+    """
+    loop = asyncio.get_running_loop()
+    interfaces = _probe_interfaces() if interfaces is None else interfaces
+    responders = {}
+
+    async def solicit(name, index):
+        try:
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM, socket.IPPROTO_ICMPV6)
+        except (OSError, AttributeError):
+            return
+        try:
+            sock.setblocking(False)
+            # The kernel fills in the checksum and identifier of ICMPv6 datagram sockets
+            packet = struct.pack('!BBHHH', ICMPV6_ECHO_REQUEST, 0, 0, 0, 1) + struct.pack('!d', time.monotonic())
+            await loop.sock_sendto(sock, packet, (IPV6_ALL_NODES, 0, 0, index))
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                data, address = await asyncio.wait_for(loop.sock_recvfrom(sock, 1024), remaining)
+                if data and data[0] == ICMPV6_ECHO_REPLY:
+                    responders[address[0].split('%')[0]] = name
+        except (asyncio.TimeoutError, OSError):
+            return
+        finally:
+            sock.close()
+
+    await asyncio.gather(*(solicit(name, index) for name, index in interfaces))
+    return responders
+
+
+async def ping_hosts(hosts, concurrency=50, timeout=1, on_alive=None, on_probe=None,
+                     rtt=None, pacer=None, retries=0, ping=ping_host):
+    """Ping every host through one bounded concurrency window.
+
+    Returns a dict of {ip: rtt} for the hosts that answered. on_alive(ip, rtt)
+    is called as soon as each host answers, on_probe(ip, rtt) after every
+    host (rtt is None for hosts that did not answer). With an RttTable
+    (app/timing.py) timeouts follow the measured RTTs, timeout only applies
+    until there is an estimate; every echo request waits for a token of
+    pacer and unanswered hosts are tried retries more times. ping is the
+    coroutine sending one echo request (a ProbeBackend's ping).
+    """
+    alive = {}
+    hosts = iter(hosts)
+    seq = 0
+
+    async def worker():
+        nonlocal seq
+        # The iterator is shared, so each worker pulls the next host as soon as it is free
+        for ip in hosts:
+            ip = str(ip)
+            result = None
+            for attempt in range(retries + 1):
+                seq = (seq + 1) & 0xFFFF
+                if pacer:
+                    await pacer.acquire()
+                result = await ping(ip, probe_timeout(rtt, ip, attempt, timeout), seq)
+                if result is not None:
+                    if rtt:
+                        rtt.observe(ip, result)
+                    break
+            if on_probe:
+                on_probe(ip, result)
+            if result is not None:
+                alive[ip] = result
+                if on_alive:
+                    on_alive(ip, result)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return alive
+
+
+async def _connect(ip, port, timeout):
+    """One TCP connect, returns (state, seconds) with state 'open', 'closed' or None on timeout"""
+    start = time.monotonic()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except ConnectionRefusedError:
+        # The RST came back, so this is a round trip as well
+        return 'closed', time.monotonic() - start
+    except asyncio.TimeoutError:
+        return None, None
+    except OSError:
+        return 'closed', None
+    elapsed = time.monotonic() - start
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return 'open', elapsed
+
+
+async def probe_port(ip, port, timeout=1, rtt=None, pacer=None, retries=0, connect=_connect):
+    """Try a TCP connect, return True if the port accepted it.
+
+    Connects that time out are retried, refused ones are final. Both
+    answered outcomes feed the RttTable.
+    """
+    for attempt in range(retries + 1):
+        if pacer:
+            await pacer.acquire()
+        state, elapsed = await connect(ip, port, probe_timeout(rtt, ip, attempt, timeout))
+        if state is not None:
+            if rtt and elapsed is not None:
+                rtt.observe(ip, elapsed)
+            return state == 'open'
+    return False
+
+
+async def scan_host_ports(ip, ports, limiter, timeout=1, rtt=None, pacer=None, retries=0, connect=_connect):
+    """Probe the ports of one host, holding a slot of the shared limiter per connect"""
+    async def probe(port):
+        async with limiter:
+            return await probe_port(ip, port, timeout, rtt, pacer, retries, connect)
+
+    results = await asyncio.gather(*(probe(port) for port in ports))
+    return sorted(port for port, is_open in zip(ports, results) if is_open)
+
+
+class ProbeBackend:
+    """Every packet NetworkScanner sends and every table it reads from the host.
+
+    This is the real network. app/simulator.py subclasses it with a
+    synthetic one so scans can be benchmarked without a LAN.
+    """
+
+    # Scanners of equal keys share caches and shard processes
+    key = 'system'
+
+    async def ping(self, ip, timeout, seq=1):
+        """One echo request, returns the RTT in seconds or None"""
+        return await ping_host(ip, timeout, seq)
+
+    async def connect(self, ip, port, timeout):
+        """One TCP connect, returns (state, seconds) with state 'open', 'closed' or None on timeout"""
+        return await _connect(ip, port, timeout)
+
+    async def fingerprint(self, ip, port, timeout):
+        """Identify the service on an open port (see app/fingerprint.py)"""
+        return await fingerprint_port(ip, port, timeout)
+
+    async def solicit_all_nodes(self, timeout):
+        """Echo to the IPv6 all-nodes group, returns {address: interface}"""
+        return await solicit_all_nodes(timeout=timeout)
+
+    def neighbor_table(self, family=socket.AF_INET):
+        """{ip: mac} from the kernel neighbor table, None when it cannot be read"""
+        return read_neighbor_table(family)
+
+    def reverse_dns(self, ip):
+        """PTR lookup, raises OSError when there is no answer"""
+        return socket.gethostbyaddr(ip)[0]
+
+    def local_address(self):
+        """(ip, mac) of the scanning host, None to detect it from the host's interfaces"""
+        return None
+
+
+system_backend = ProbeBackend()
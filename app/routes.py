@@ -1,15 +1,20 @@
-from flask import Blueprint, render_template, jsonify, request, abort, redirect, url_for, session, g
+from flask import Blueprint, render_template, jsonify, request, abort, redirect, url_for, session, g, current_app
 from flask_socketio import emit
 from flask import session as flask_session
 from app import socketio
-from app.models import Device, NetworkScan, Stats, User
-from app.scanner import NetworkScanner
+from app.models import Device, DeviceHistory, NetworkScan, Settings, Stats, User
+from app.scan_worker import ScanWorkerClient
+from app.scheduler import ScanScheduler
 from app.audit_log import write_log
 import threading
 import time
-from datetime import datetime
-import paramiko
-import winrm
+import atexit
+import hmac
+import ipaddress
+import json
+import re
+import zlib
+from datetime import datetime, timedelta
 
 # Store active sessions in memory (per user session)
 terminal_sessions = {}
@@ -28,14 +33,13 @@ def enforce_https_and_require_login():
         url = request.url.replace('http://', 'https://', 1)
         return redirect(url, code=301)
     # Require login
-    allowed_routes = ['main.login', 'main.register', 'static']
+    allowed_routes = ['main.login', 'main.register', 'main.ingest', 'static']
     if request.endpoint not in allowed_routes and not session.get('logged_in'):
         return redirect(url_for('main.login'))
 
 # --- Login/Register routes ---
 @main.route('/login', methods=['GET', 'POST'])
 def login():
-    User.create_table()
     if not User.user_exists():
         return redirect(url_for('main.register'))
     error = None
@@ -54,7 +58,6 @@ def login():
 
 @main.route('/register', methods=['GET', 'POST'])
 def register():
-    User.create_table()
     if User.user_exists():
         return redirect(url_for('main.login'))
     error = None
@@ -80,10 +83,29 @@ def logout():
     session.clear()
     return redirect(url_for('main.login'))
 
-# Global scanner instance
-scanner = NetworkScanner()
+# Scans run in a worker process, started on first use so importing this module does no I/O
+scan_worker = None
+scan_worker_lock = threading.Lock()
 scan_in_progress = False
 
+# The app this blueprint is registered on, for work done outside of requests
+app = None
+
+@main.record_once
+def remember_app(state):
+    global app
+    app = state.app
+
+def get_scan_worker():
+    """Return the client of the scan worker process, creating it on first use"""
+    global scan_worker
+    if scan_worker is None:
+        with scan_worker_lock:
+            if scan_worker is None:
+                scan_worker = ScanWorkerClient(progress_interval=app.config['SCAN_PROGRESS_INTERVAL'])
+                atexit.register(scan_worker.close)
+    return scan_worker
+
 @main.route('/')
 def dashboard():
     """Main dashboard page"""
@@ -127,6 +149,7 @@ def handle_run_command(data):
     if os_type == 'windows':
         # Windows (WinRM) --> TODO requires testing
         try:
+            import winrm
             print(f"[SSH] Connecting to WinRM at {ip}")
             session = winrm.Session(f'http://{ip}:5985/wsman', auth=(username, password))
             r = session.run_cmd(command)
@@ -148,6 +171,7 @@ def handle_run_command(data):
     else:
         # For linux devices (android not tested yet, but probably works with open port)
         try:
+            import paramiko
             print(f"[SSH] Connecting to SSH at {ip}")
             ssh = paramiko.SSHClient()
             ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -250,6 +274,27 @@ def get_active_devices():
             'error': str(e)
         }), 500
 
+@main.route('/api/devices/<mac_address>/history')
+def get_device_history(mac_address):
+    """API endpoint to get a device's uptime timeline per hour or per day"""
+    resolution = request.args.get('resolution', 'hour')
+    if resolution not in DeviceHistory.ROLLUPS:
+        return jsonify({'success': False, 'error': f"resolution must be one of {', '.join(DeviceHistory.ROLLUPS)}"}), 400
+    days = request.args.get('days', 1 if resolution == 'hour' else 30, type=float)
+    size = DeviceHistory.ROLLUPS[resolution][1]
+    if not 0 < days * 86400 / size <= current_app.config['HISTORY_MAX_BUCKETS']:
+        return jsonify({'success': False, 'error': 'Too many buckets, use a coarser resolution or fewer days'}), 400
+    try:
+        start = DeviceHistory.utcnow() - timedelta(days=days)
+        history = DeviceHistory.timeline(mac_address, resolution, start=start)
+        if history is None:
+            return jsonify({'success': False, 'error': 'Device not found'}), 404
+        return jsonify(dict(history, success=True))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
 def get_session_id():
     # Use Flask session id or username as key
@@ -274,6 +319,7 @@ def handle_terminal_connect(data):
             terminal_sessions.pop(sid, None)
         try:
             if data.get('os', '').lower() == 'windows':
+                import winrm
                 session = winrm.Session(f'http://{data.get('ip')}:5985/wsman', auth=(data.get('username'), data.get('password')))
                 # Test connection
                 r = session.run_cmd('echo connected')
@@ -285,6 +331,7 @@ def handle_terminal_connect(data):
             else:
                 private_key = data.get('private_key')
                 passphrase = data.get('passphrase')
+                import paramiko
                 ssh = paramiko.SSHClient()
                 ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
                 connected = False
@@ -430,49 +477,277 @@ def scan_status():
         'recent_scans': recent_scans
     })
 
-from app.app_ctx import app
-def perform_network_scan():
-    """Perform network scan and update database"""
+@main.route('/api/ingest', methods=['POST'])
+def ingest():
+    """API endpoint for remote scan agents to push batched device deltas"""
+    auth = request.headers.get('Authorization', '')
+    token = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+    if not token or not any(hmac.compare_digest(token, t) for t in current_app.config['AGENT_TOKENS']):
+        return jsonify({'success': False, 'error': 'Invalid agent token'}), 401
+
+    max_bytes = current_app.config['INGEST_MAX_BYTES']
+    body = request.get_data()
+    try:
+        if request.headers.get('Content-Encoding') == 'gzip':
+            # Bounded decompression, a tiny request must not inflate without limit
+            body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body, max_bytes + 1)
+        if len(body) > max_bytes:
+            return jsonify({'success': False, 'error': 'Batch too large'}), 413
+        batch = json.loads(body)
+        if not isinstance(batch, dict):
+            raise ValueError('batch must be an object')
+        agent = ingested_value(batch.get('agent'), 'agent', str) or request.remote_addr
+        scan = ingested_value(batch.get('scan'), 'scan', dict, {})
+        batch_index = ingested_value(scan.get('batch'), 'batch', int, 0)
+        batches = ingested_value(scan.get('batches'), 'batches', int, 1)
+        if not 0 <= batch_index < batches:
+            raise ValueError(f'batch {batch_index} of {batches}')
+        devices = [ingested_device(device) for device in ingested_value(batch.get('devices'), 'devices', list, [])]
+        seen = [(ingested_mac(mac), ingested_ip(ip)) for mac, ip in ingested_value(batch.get('seen'), 'seen', list, [])]
+        ranges = [ipaddress.ip_network(ingested_value(cidr, 'range', str), strict=False)
+                  for cidr in ingested_value(scan.get('ranges'), 'ranges', list, [])]
+        devices_found = ingested_value(scan.get('devices_found'), 'devices_found', int, len(devices))
+        duration = ingested_value(scan.get('duration'), 'duration', (int, float), 0)
+    except (zlib.error, ValueError, TypeError, KeyError, AttributeError) as e:
+        return jsonify({'success': False, 'error': f'Malformed batch: {e}'}), 400
+
+    # The first batch of a scan resets the agent's devices in its ranges, later batches only add to them
+    source = f'agent:{agent}'
+    if batch_index == 0 and ranges:
+        Device.mark_ranges_inactive(ranges, source)
+    result = Device.bulk_upsert(devices, source)
+    # Sightings of devices the server no longer has, the agent resends those in full
+    unknown = Device.mark_seen(seen, source)
+
+    for device in devices:
+        socketio.emit('device_discovered', stored_device_event(device, result['last_seen']))
+
+    if batch_index == batches - 1:
+        NetworkScan.log_scan(devices_found, duration, source)
+        run_maintenance()
+        write_log(f"INGEST: Agent '{agent}' reported {devices_found} devices from IP {request.remote_addr}")
+
+    return jsonify({
+        'success': True,
+        'devices': len(devices),
+        'seen': len(seen) - len(unknown),
+        'unknown': unknown
+    })
+
+# Six hex pairs separated by colons (Linux, macOS) or dashes (Windows arp -a)
+MAC_ADDRESS = re.compile(r'[0-9A-Fa-f]{2}([:-])(?:[0-9A-Fa-f]{2}\1){4}[0-9A-Fa-f]{2}')
+
+def ingested_value(value, name, kind, default=None):
+    """value when it is of type kind, default when it is missing (None), ValueError otherwise"""
+    if value is None:
+        return default
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise ValueError(f'invalid {name}: {value!r}')
+    return value
+
+def ingested_ip(value):
+    """An IP address from an agent batch in its canonical form"""
+    if not isinstance(value, str):
+        raise ValueError(f'invalid IP address: {value!r}')
+    return str(ipaddress.ip_address(value))
+
+def ingested_mac(value):
+    """A MAC address from an agent batch, None for devices without one"""
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str) or not MAC_ADDRESS.fullmatch(value):
+        raise ValueError(f'invalid MAC address: {value!r}')
+    return value
+
+def ingested_port(value):
+    """A port number from an agent batch"""
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 < value < 65536:
+        raise ValueError(f'invalid port: {value!r}')
+    return value
+
+def ingested_device(device):
+    """Map a device from an agent batch onto the devices table columns, ValueError when a field is invalid"""
+    if not isinstance(device, dict):
+        raise ValueError(f'invalid device: {device!r}')
+    device_data = {
+        'ip_address': ingested_ip(device.get('ip')),
+        'mac_address': ingested_mac(device.get('mac')),
+        'hostname': ingested_value(device.get('hostname'), 'hostname', str),
+        'vendor': ingested_value(device.get('vendor'), 'vendor', str),
+        'device_type': ingested_value(device.get('device_type'), 'device_type', str) or 'Unknown',
+        'open_ports': [ingested_port(port) for port in ingested_value(device.get('open_ports'), 'open_ports', list, [])],
+        'method': ingested_value(device.get('method'), 'method', str),
+        'ipv6_addresses': [str(ipaddress.IPv6Address(ingested_value(address, 'IPv6 address', str)))
+                           for address in ingested_value(device.get('ipv6_addresses'), 'ipv6_addresses', list, [])],
+        'services': [
+            {
+                'port': ingested_port(service['port']),
+                'service': str(service.get('service') or ''),
+                'banner': str(service.get('banner') or '')[:200],
+                'cn': str(service['cn'])[:200] if service.get('cn') else None
+            }
+            for service in ingested_value(device.get('services'), 'services', list)
+        ] if device.get('services') is not None else None,
+        'is_active': 1
+    }
+    for field in ('hostname_checked_at', 'ports_checked_at'):
+        value = ingested_value(device.get(field), field, str)
+        device_data[field] = datetime.fromisoformat(value) if value else None
+    return device_data
+
+def device_row(device_info):
+    """Map a device from the scanner onto the devices table columns"""
+    device_data = dict(device_info)
+    # Normalize keys for DB
+    if 'ip' in device_data:
+        device_data['ip_address'] = device_data['ip']
+    if 'mac' in device_data:
+        device_data['mac_address'] = device_data['mac']
+    device_data['is_active'] = 1
+    return device_data
+
+class ScanWriter:
+    """Stores a scan's devices in batches and pushes each batch to clients once it is committed.
+
+    A batch is written when it reaches batch_size devices or its oldest
+    device has waited interval seconds; flush() writes the rest.
+    """
+
+    def __init__(self, batch_size, interval):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.inserted = 0
+        self.updated = 0
+        self._pending = []
+        self._started_at = None
+        self._lock = threading.Lock()
+
+    def add(self, device_info):
+        with self._lock:
+            if not self._pending:
+                self._started_at = time.monotonic()
+            self._pending.append(device_row(device_info))
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._started_at >= self.interval:
+                self._write()
+
+    def flush(self, due_only=False):
+        """Write the pending devices, or with due_only only when they have waited interval seconds"""
+        with self._lock:
+            if self._pending and (not due_only or time.monotonic() - self._started_at >= self.interval):
+                self._write()
+
+    def _write(self):
+        batch, self._pending = self._pending, []
+        with app.app_context():
+            result = Device.bulk_upsert(batch)
+        self.inserted += len(result['inserted'])
+        self.updated += len(result['updated'])
+        for device_data in batch:
+            socketio.emit('device_discovered', stored_device_event(device_data, result['last_seen']))
+
+def store_passive_device(device_info):
+    """Save a device learned from passive capture without clobbering its scanned fields"""
+    device_data = dict(device_info, ip_address=device_info['ip'], mac_address=device_info['mac'], is_active=1)
+    with app.app_context():
+        stored = Device.record_sighting(device_data)
+    socketio.emit('device_discovered', stored_device_event(dict(device_data, **stored), stored['last_seen']))
+
+maintenance_runs = {}  # task name -> time.monotonic() of its last run
+
+def maintenance_due(task, interval):
+    """True when a periodic task has not run for interval seconds, which marks it as run"""
+    now = time.monotonic()
+    if task in maintenance_runs and now - maintenance_runs[task] < interval:
+        return False
+    maintenance_runs[task] = now
+    return True
+
+def run_maintenance():
+    """Prune the presence history and check the dashboard counters, each at most once per its interval"""
+    with app.app_context():
+        if maintenance_due('history', app.config['HISTORY_PRUNE_INTERVAL']):
+            deleted = DeviceHistory.prune()
+            if any(deleted.values()):
+                print(f"Pruned presence history: {deleted}")
+        if maintenance_due('stats', app.config['STATS_CHECK_INTERVAL']):
+            mismatches = Stats.check_consistency()
+            if mismatches:
+                print(f"Dashboard counters were off, rebuilt them: {mismatches}")
+
+def stored_device_event(device_data, last_seen):
+    """device_event of a device the way it was stored: normalized MAC address and the UTC last_seen written"""
+    event = dict(device_data, last_seen=last_seen)
+    for key in ('mac', 'mac_address'):
+        if key in event:
+            event[key] = Device.normalize_mac(event[key])
+    return device_event(event)
+
+def device_event(device_data):
+    """JSON-safe copy of a device for Socket.IO events"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in device_data.items()
+    }
+
+def perform_network_scan(network_ranges=None, scan_type='full_scan', refresh_intervals=None):
+    """Perform network scan and update database.
+
+    Scans the network_range setting unless network_ranges is given;
+    refresh_intervals forces or skips enrichment of known devices (see
+    app/scheduler.py).
+    """
     global scan_in_progress
     scan_in_progress = True
 
     try:
         with app.app_context():
-            # Set all devices to inactive before scan
-            from app.models import DatabaseManager
-            conn = DatabaseManager.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE devices SET is_active = 0")
-            conn.commit()
-            conn.close()
+            if network_ranges is None:
+                network_ranges = Settings.get('network_range')
 
             # Emit scan started event
-            socketio.emit('scan_started', {'message': 'Network scan started'})
+            socketio.emit('scan_started', {'message': 'Network scan started', 'scan_type': scan_type})
+
+            def on_started(ranges):
+                # Set the devices of the scanned ranges to inactive before any result arrives
+                with app.app_context():
+                    Device.mark_ranges_inactive([ipaddress.ip_network(cidr) for cidr in ranges])
+
+            # The worker process does the scanning; devices are stored and streamed in batches as they arrive
+            writer = ScanWriter(app.config['DB_WRITE_BATCH_SIZE'], app.config['DB_WRITE_INTERVAL'])
 
-            # Perform the scan
-            devices_found, scan_duration = scanner.full_scan()
+            def on_progress(progress):
+                writer.flush(due_only=True)
+                socketio.emit('scan_progress', progress)
 
-            # Update database and mark found devices as active
-            for device_data in devices_found:
-                # Normalize keys for DB
-                if 'ip' in device_data:
-                    device_data['ip_address'] = device_data['ip']
-                if 'mac' in device_data:
-                    device_data['mac_address'] = device_data['mac']
-                device_data['is_active'] = 1
-                Device.upsert(device_data)
+            known_devices = None
+            if app.config['INCREMENTAL_SCAN'] or refresh_intervals:
+                known_devices = Device.get_known_state()
+            try:
+                devices_found, scan_duration = get_scan_worker().scan(
+                    network_ranges=network_ranges,
+                    known_devices=known_devices,
+                    refresh_intervals=refresh_intervals,
+                    on_started=on_started,
+                    on_device=writer.add,
+                    on_progress=on_progress
+                )
+            finally:
+                # Keep what the scan found even when it failed part way
+                writer.flush()
 
             # Log the scan
-            NetworkScan.log_scan(len(devices_found), scan_duration, 'full_scan')
+            NetworkScan.log_scan(devices_found, scan_duration, scan_type)
+            run_maintenance()
 
             # Emit scan completed event
             socketio.emit('scan_completed', {
                 'message': 'Network scan completed',
-                'devices_found': len(devices_found),
+                'scan_type': scan_type,
+                'devices_found': devices_found,
                 'duration': scan_duration
             })
 
-            print(f"Network scan completed: {len(devices_found)} devices found in {scan_duration:.2f} seconds")
+            print(f"Network scan completed: {devices_found} devices found in {scan_duration:.2f} seconds")
 
     except Exception as e:
         print(f"Scan error: {e}")
@@ -506,16 +781,79 @@ def handle_device_update():
     except Exception as e:
         emit('error', {'message': str(e)})
 
-# Auto-scan functionality (runs every 5 minutes)
-def auto_scan():
-    """Automatic network scanning"""
+# Scheduled scanning: cheap discovery often, port and DNS refreshes rarely
+SCAN_JOB_SETTINGS = {
+    'discovery': ('scan_interval', 'SCAN_INTERVAL'),
+    'ports': ('port_scan_interval', 'PORT_SCAN_INTERVAL'),
+    'dns': ('dns_refresh_interval', 'DNS_REFRESH_INTERVAL'),
+}
+
+def load_scan_jobs():
+    """Build the scheduler's jobs from the settings table, one per job kind and subnet"""
+    with app.app_context():
+        if str(Settings.get('auto_scan_enabled', 'true')).lower() != 'true':
+            return {}
+        port_scan_enabled = str(Settings.get('port_scan_enabled', 'true')).lower() == 'true'
+        subnets = get_scan_worker().resolve_ranges(Settings.get('network_range'))
+
+        jobs = {}
+        for kind, (setting_name, config_name) in SCAN_JOB_SETTINGS.items():
+            if kind == 'ports' and not port_scan_enabled:
+                continue
+            default = app.config[config_name]
+            try:
+                interval = float(Settings.get(setting_name, default))
+            except (TypeError, ValueError):
+                print(f"Invalid {setting_name} setting, using {default}")
+                interval = default
+            if interval <= 0:
+                continue
+            for subnet in subnets:
+                jobs[(kind, subnet)] = interval
+        return jobs
+
+def run_scan_job(job):
+    """Run one scheduled job, returns False when another scan is running"""
+    if scan_in_progress:
+        return False
+    print(f"Starting scheduled {job.kind} scan of {job.network_range}...")
+    perform_network_scan(
+        network_ranges=job.network_range,
+        scan_type=job.kind,
+        refresh_intervals=job.refresh_intervals
+    )
+    return True
+
+def run_passive_discovery(interface=None, pcap=None):
+    """Keep passive discovery running in the scan worker, restarting it with the worker"""
     while True:
-        time.sleep(300)  # 5 minutes
-        if not scan_in_progress:
-            print("Starting automatic network scan...")
-            perform_network_scan()
-
-# Start auto-scan thread when module loads (global)
-auto_scan_thread = threading.Thread(target=auto_scan)
-auto_scan_thread.daemon = True
-auto_scan_thread.start()
+        job = get_scan_worker().watch(interface=interface, pcap=pcap, on_device=store_passive_device)
+        try:
+            result = job.wait()
+            print(f"Passive discovery read {result['frames']} frames, {result['devices_found']} devices")
+            return
+        except RuntimeError as e:
+            print(f"Passive discovery stopped: {e}")
+            if str(e) != 'Scan worker exited':
+                return
+        time.sleep(app.config['SCHEDULER_TICK'])
+
+scan_scheduler = None
+passive_thread = None
+
+def start_background_tasks():
+    """Start the scan scheduler and passive discovery, called once by run.py in the serving process"""
+    global scan_scheduler, passive_thread
+    interface, pcap = app.config['PASSIVE_INTERFACE'], app.config['PASSIVE_PCAP']
+    if (interface or pcap) and passive_thread is None:
+        passive_thread = threading.Thread(target=run_passive_discovery, args=(interface, pcap), daemon=True)
+        passive_thread.start()
+    if scan_scheduler is None:
+        scan_scheduler = ScanScheduler(
+            load_scan_jobs,
+            run_scan_job,
+            jitter=app.config['SCAN_JITTER'],
+            tick=app.config['SCHEDULER_TICK']
+        )
+    scan_scheduler.start()
+    return scan_scheduler
@@ -0,0 +1,352 @@
+import argparse
+import itertools
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+from datetime import datetime
+
+from config import Config as conf
+
+# this file runs scans in a separate worker process, away from the web server's event loop
+
+DATETIME_FIELDS = ('last_seen', 'hostname_checked_at', 'ports_checked_at')
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_message(message):
+    return (json.dumps(message, default=_json_default) + '\n').encode('utf-8')
+
+
+def decode_device(device):
+    """Turn the datetime fields of a device received over the wire back into datetimes"""
+    for field in DATETIME_FIELDS:
+        value = device.get(field)
+        if isinstance(value, str):
+            try:
+                device[field] = datetime.fromisoformat(value)
+            except ValueError:
+                device[field] = None
+    return device
+
+
+class WorkerJob:
+    """A request sent to the worker, completed by its result or error message"""
+
+    def __init__(self, job_id, handlers):
+        self.id = job_id
+        self.handlers = handlers
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Scan worker did not answer job {self.id}")
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.result
+
+
+class ScanWorkerClient:
+    """Web side of the worker: starts the process on first use and routes its messages to jobs.
+
+    The web process listens on a localhost socket and starts the worker, which
+    connects back. Both sides exchange newline-delimited JSON messages tagged
+    with a job id:
+      web -> worker: scan, resolve, passive
+      worker -> web: ready, started, progress, device, result, ranges, error
+    """
+
+    def __init__(self, progress_interval=2, start_timeout=30):
+        self.progress_interval = progress_interval
+        self.start_timeout = start_timeout
+        self.process = None
+        self._sock = None
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    @property
+    def alive(self):
+        return self._sock is not None and self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the worker process and wait for it to connect back"""
+        token = secrets.token_hex(16)
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.bind(('127.0.0.1', 0))
+            listener.listen(1)
+            listener.settimeout(self.start_timeout)
+            env = dict(os.environ, SCAN_WORKER_TOKEN=token)
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'app.scan_worker',
+                 '--port', str(listener.getsockname()[1]),
+                 '--progress-interval', str(self.progress_interval)],
+                cwd=PROJECT_ROOT,
+                env=env
+            )
+            while True:
+                conn, _ = listener.accept()
+                conn.settimeout(self.start_timeout)
+                reader = conn.makefile('r', encoding='utf-8')
+                try:
+                    hello = json.loads(reader.readline() or '{}')
+                except (OSError, ValueError):
+                    hello = {}
+                # Only the process we started knows the token
+                if hello.get('type') == 'ready' and secrets.compare_digest(str(hello.get('token')), token):
+                    conn.settimeout(None)
+                    break
+                reader.close()
+                conn.close()
+        except Exception:
+            if self.process and self.process.poll() is None:
+                self.process.kill()
+            self.process = None
+            raise
+        finally:
+            listener.close()
+
+        self._sock = conn
+        threading.Thread(target=self._read_loop, args=(reader,), daemon=True).start()
+        print(f"Scan worker started (pid {self.process.pid})")
+
+    def _ensure_started(self):
+        with self._lock:
+            if not self.alive:
+                self.close()
+                self.start()
+
+    def _read_loop(self, reader):
+        try:
+            for line in reader:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                job = self._jobs.get(message.get('id'))
+                if job is None:
+                    continue
+                kind = message.get('type')
+                if kind in ('result', 'ranges'):
+                    self._jobs.pop(job.id, None)
+                    job.finish(result=message)
+                elif kind == 'error':
+                    self._jobs.pop(job.id, None)
+                    job.finish(error=message.get('error'))
+                else:
+                    handler = job.handlers.get(kind)
+                    if handler:
+                        try:
+                            handler(message)
+                        except Exception as e:
+                            print(f"Scan worker {kind} handler failed: {e}")
+        except OSError:
+            pass
+        finally:
+            # The worker went away, fail whatever was waiting on it
+            self._sock = None
+            for job_id in list(self._jobs):
+                self._jobs.pop(job_id).finish(error='Scan worker exited')
+
+    def request(self, message, **handlers):
+        """Send one request, returns the WorkerJob tracking it"""
+        self._ensure_started()
+        job = WorkerJob(next(self._ids), handlers)
+        self._jobs[job.id] = job
+        try:
+            with self._send_lock:
+                self._sock.sendall(encode_message(dict(message, id=job.id)))
+        except (OSError, AttributeError) as e:
+            self._jobs.pop(job.id, None)
+            job.finish(error=f'Could not reach scan worker: {e}')
+        return job
+
+    def scan(self, network_ranges=None, known_devices=None, refresh_intervals=None,
+             on_started=None, on_device=None, on_progress=None):
+        """Run a scan in the worker, blocking until it finishes.
+
+        on_started(ranges) gets the resolved CIDRs before any device arrives,
+        on_device(device_info) each device as it is enriched and
+        on_progress(snapshot) the periodic progress. Returns
+        (devices_found, duration).
+        """
+        handlers = {
+            'started': lambda message: on_started and on_started(message['ranges']),
+            'device': lambda message: on_device and on_device(decode_device(message['device'])),
+            'progress': lambda message: on_progress and on_progress(message['progress']),
+        }
+        job = self.request({
+            'type': 'scan',
+            'network_ranges': network_ranges,
+            'known_devices': known_devices,
+            'refresh_intervals': refresh_intervals
+        }, **handlers)
+        result = job.wait()
+        return result['devices_found'], result['duration']
+
+    def watch(self, interface=None, pcap=None, on_device=None):
+        """Start passive discovery in the worker, returns the WorkerJob.
+
+        on_device(device_info) gets every device the capture learns; the job
+        only finishes when a pcap replay ends or the capture fails.
+        """
+        return self.request(
+            {'type': 'passive', 'interface': interface, 'pcap': pcap},
+            device=lambda message: on_device and on_device(message['device'])
+        )
+
+    def resolve_ranges(self, network_ranges=None, timeout=30):
+        """Resolve a network_range setting to CIDR strings the way the scanner would"""
+        job = self.request({'type': 'resolve', 'network_ranges': network_ranges})
+        return job.wait(timeout)['ranges']
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+class ScanWorker:
+    """Worker side: runs scans with NetworkScanner and streams their output back"""
+
+    def __init__(self, sock, progress_interval=2):
+        from app.scanner import NetworkScanner
+        self.sock = sock
+        self.progress_interval = progress_interval
+        self.scanner = NetworkScanner()
+        self.scanning = threading.Lock()
+        self.passive = None
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        with self._send_lock:
+            self.sock.sendall(encode_message(message))
+
+    def serve(self):
+        """Handle requests until the web process closes the connection"""
+        for line in self.sock.makefile('r', encoding='utf-8'):
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            kind = message.get('type')
+            if kind == 'scan':
+                if not self.scanning.acquire(blocking=False):
+                    self.send({'type': 'error', 'id': message.get('id'), 'error': 'Scan already in progress'})
+                    continue
+                # Scans run on their own thread so resolve requests are answered meanwhile
+                threading.Thread(target=self.run_scan, args=(message,), daemon=True).start()
+            elif kind == 'passive':
+                if self.passive is not None:
+                    self.send({'type': 'error', 'id': message.get('id'), 'error': 'Passive discovery already running'})
+                    continue
+                self.passive = threading.Thread(target=self.run_passive, args=(message,), daemon=True)
+                self.passive.start()
+            elif kind == 'resolve':
+                try:
+                    ranges = self.scanner.get_network_ranges(message.get('network_ranges'))
+                    self.send({'type': 'ranges', 'id': message.get('id'), 'ranges': [str(r) for r in ranges]})
+                except Exception as e:
+                    self.send({'type': 'error', 'id': message.get('id'), 'error': str(e)})
+            else:
+                self.send({'type': 'error', 'id': message.get('id'), 'error': f'Unknown request {kind}'})
+
+    def run_scan(self, message):
+        job_id = message.get('id')
+        finished = threading.Event()
+
+        def report_progress():
+            while not finished.wait(self.progress_interval):
+                self.send({'type': 'progress', 'id': job_id, 'progress': self.scanner.progress.snapshot()})
+
+        try:
+            known_devices = {
+                mac: decode_device(known)
+                for mac, known in (message.get('known_devices') or {}).items()
+            }
+            network_ranges = message.get('network_ranges')
+            ranges = self.scanner.get_network_ranges(network_ranges)
+            self.send({'type': 'started', 'id': job_id, 'ranges': [str(r) for r in ranges]})
+
+            threading.Thread(target=report_progress, daemon=True).start()
+            devices, duration = self.scanner.full_scan(
+                known_devices=known_devices if message.get('known_devices') is not None else None,
+                network_ranges=network_ranges,
+                on_device=lambda device_info: self.send({'type': 'device', 'id': job_id, 'device': device_info}),
+                refresh_intervals=message.get('refresh_intervals')
+            )
+            finished.set()
+            self.send({'type': 'progress', 'id': job_id, 'progress': self.scanner.progress.snapshot()})
+            self.send({'type': 'result', 'id': job_id, 'devices_found': len(devices), 'duration': duration})
+        except Exception as e:
+            self.send({'type': 'error', 'id': job_id, 'error': str(e)})
+        finally:
+            finished.set()
+            self.scanning.release()
+
+    def run_passive(self, message):
+        from app.passive import PassiveMonitor, open_source
+        job_id = message.get('id')
+        try:
+            monitor = PassiveMonitor(
+                lambda device_info: self.send({'type': 'device', 'id': job_id, 'device': device_info}),
+                refresh_interval=conf.PASSIVE_REFRESH_INTERVAL,
+                oui=self.scanner.oui,
+                classifier=self.scanner.classifier
+            )
+            frames = monitor.run(open_source(message.get('interface'), message.get('pcap')))
+            self.send({'type': 'result', 'id': job_id, 'frames': frames, 'devices_found': len(monitor.devices)})
+        except Exception as e:
+            self.send({'type': 'error', 'id': job_id, 'error': str(e)})
+        finally:
+            self.passive = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard Scan Worker')
+    parser.add_argument('--port', type=int, required=True, help='Localhost port the web process listens on')
+    parser.add_argument('--progress-interval', type=float, default=conf.SCAN_PROGRESS_INTERVAL,
+                        help='Seconds between progress messages')
+    args = parser.parse_args()
+
+    sock = socket.create_connection(('127.0.0.1', args.port))
+    worker = ScanWorker(sock, progress_interval=args.progress_interval)
+    worker.send({'type': 'ready', 'token': os.environ.get('SCAN_WORKER_TOKEN'), 'pid': os.getpid()})
+    try:
+        worker.serve()
+    finally:
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,43 +6,243 @@ import threading
 from datetime import datetime
 import time
 import json
+import asyncio
+import queue
+import multiprocessing
+import functools
+from concurrent.futures import Future, ProcessPoolExecutor
 
 from config import Config as conf
+from app.classifier import get_classifier
+from app.dns_cache import ReverseDNSCache, reverse_dns
+from app.fingerprint import ServiceCache, fingerprint_services, service_cache
+from app.neighbors import NeighborTable
+from app.oui import get_oui_index
+from app.probes import ping_hosts, scan_host_ports, system_backend
+from app.timing import RttTable, probe_pacer
 networkRange = conf.NETWORK_RANGE
 
-try:
-    from mac_vendor_lookup import MacLookup
-    MAC_LOOKUP_AVAILABLE = True
-except ImportError:
-    MAC_LOOKUP_AVAILABLE = False
-    print("Warning: mac-vendor-lookup not available. Install with: pip install mac-vendor-lookup")
+def parse_network_ranges(value):
+    """Parse a list or comma/space separated string of CIDRs; "auto" and empty mean none"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'[\s,]+', value.strip())
+    networks = []
+    for item in value:
+        if not item or str(item).lower() == 'auto':
+            continue
+        try:
+            networks.append(ipaddress.IPv4Network(str(item), strict=False))
+        except ValueError:
+            print(f"Ignoring invalid network range: {item}")
+    return list(ipaddress.collapse_addresses(networks))
+
+def split_into_shards(networks, prefix):
+    """Split networks into subnets no bigger than /prefix"""
+    shards = []
+    for network in networks:
+        if network.prefixlen >= prefix:
+            shards.append(network)
+        else:
+            shards.extend(network.subnets(new_prefix=prefix))
+    return shards
+
+_shard_scanners = {}
+
+def scan_shard(cidr, skip_ips, known_devices, refresh_intervals=None, backend=None):
+    """Process pool entry point: sweep and enrich one shard, return its devices"""
+    backend = backend or system_backend
+    scanner = _shard_scanners.get(backend.key)
+    if scanner is None:
+        # One scanner per worker process (and backend) so its caches survive across shards and scans
+        scanner = _shard_scanners[backend.key] = NetworkScanner(backend=backend)
+        # The shard processes split the probe rate between them
+        probe_pacer.configure(conf.PROBE_RATE / max(1, conf.SCAN_PROCESSES), conf.PROBE_BURST)
+    return scanner.scan_range(ipaddress.IPv4Network(cidr), skip_ips, known_devices, refresh_intervals)
+
+class ScanRegistry:
+    """Hosts discovered during one scan, indexed by both IP and MAC.
+
+    Every discovery method reports into the same record, so each device is
+    enriched and port-scanned once no matter how many methods saw it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_ip = {}
+        self.by_mac = {}
+
+    def __contains__(self, ip):
+        return ip in self.by_ip
+
+    def ips(self):
+        with self._lock:
+            return list(self.by_ip)
+
+    def observe(self, ip, mac, method):
+        """Record that a method saw a host, returns its record if it is new and needs enrichment"""
+        with self._lock:
+            record = self.by_ip.get(ip) or (self.by_mac.get(mac) if mac else None)
+            if record is not None:
+                if method not in record['methods']:
+                    record['methods'].append(method)
+                if mac and not record['mac']:
+                    record['mac'] = mac
+                    self.by_mac[mac] = record
+                self.by_ip.setdefault(ip, record)
+                return None
+            record = {'ip': ip, 'mac': mac, 'methods': [method]}
+            self.by_ip[ip] = record
+            if mac:
+                self.by_mac[mac] = record
+            return record
+
+    def claim_mac(self, record, mac):
+        """Attach a MAC found during enrichment, returns False if another record already has it"""
+        with self._lock:
+            owner = self.by_mac.get(mac)
+            if owner is not None and owner is not record:
+                for method in record['methods']:
+                    if method not in owner['methods']:
+                        owner['methods'].append(method)
+                self.by_ip[record['ip']] = owner
+                return False
+            record['mac'] = mac
+            self.by_mac[mac] = record
+            return True
+
+    def methods(self, ip):
+        with self._lock:
+            record = self.by_ip.get(ip)
+            return list(record['methods']) if record else []
+
+class ScanProgress:
+    """Thread-safe counters describing the scan that is running"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start(0)
+        self.running = False
+
+    def start(self, total):
+        with self._lock:
+            self.total = total
+            self.probed = 0
+            self.found = 0
+            self.started_at = time.time()
+            self.running = True
+
+    def add_probed(self, count=1):
+        with self._lock:
+            self.probed += count
+
+    def add_found(self, count=1):
+        with self._lock:
+            self.found += count
+
+    def finish(self):
+        with self._lock:
+            self.probed = max(self.probed, self.total)
+            self.running = False
+
+    def snapshot(self):
+        """Progress as a JSON-friendly dict, with an ETA once probes have completed"""
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            probed = min(self.probed, self.total)
+            eta = None
+            if self.running and probed:
+                eta = elapsed / probed * (self.total - probed)
+            return {
+                'probed': probed,
+                'total': self.total,
+                'found': self.found,
+                'elapsed': round(elapsed, 1),
+                'eta': round(eta, 1) if eta is not None else None
+            }
 
 class NetworkScanner:
-    def __init__(self, network_range=networkRange):
+    def __init__(self, network_range=networkRange, backend=None):
         self.network_range = network_range
+        # Every probe and host table read goes through the backend (see ProbeBackend)
+        self.backend = backend or system_backend
         self.devices = []
         self.scan_lock = threading.Lock()
-        if MAC_LOOKUP_AVAILABLE:
-            self.mac_lookup = MacLookup()
-            self.mac_lookup.update_vendors()
-        # Detect local IP and MAC
-        self.local_ip = self._get_local_ip()
-        self.local_mac = self._get_local_mac(self.local_ip)
-        # Fallback: get MAC from local interfaces if not found
-        if not self.local_mac:
-            try:
-                import netifaces
-                for iface in netifaces.interfaces():
-                    addrs = netifaces.ifaddresses(iface)
-                    if netifaces.AF_INET in addrs:
-                        for addr in addrs[netifaces.AF_INET]:
-                            if addr.get('addr') == self.local_ip:
-                                mac = addrs.get(netifaces.AF_LINK, [{}])[0].get('addr')
-                                if mac:
-                                    self.local_mac = mac
-                                    break
-            except ImportError:
-                print("Warning: netifaces not installed. Local MAC fallback unavailable.")
+        self._process_pool = None
+        self.progress = ScanProgress()
+        self.timings = {}
+        if self.backend is system_backend:
+            self.dns_cache = reverse_dns
+            self.service_cache = service_cache
+        else:
+            self.dns_cache = ReverseDNSCache(
+                ttl=conf.DNS_CACHE_TTL,
+                negative_ttl=conf.DNS_NEGATIVE_TTL,
+                max_size=conf.DNS_CACHE_SIZE,
+                timeout=conf.DNS_TIMEOUT,
+                workers=conf.DNS_WORKERS,
+                resolver=self.backend.reverse_dns
+            )
+            self.service_cache = ServiceCache(ttl=conf.SERVICE_CACHE_TTL, max_size=conf.SERVICE_CACHE_SIZE)
+        # RTT estimates outlive a scan, so the next one starts with tight timeouts
+        self.rtt = RttTable(min_timeout=conf.PROBE_MIN_TIMEOUT, max_timeout=conf.PROBE_MAX_TIMEOUT)
+        self.pacer = probe_pacer
+        self._classifier = None
+        self.neighbors = NeighborTable(min_refresh=conf.NEIGHBOR_REFRESH_INTERVAL, reader=self.backend.neighbor_table)
+        # Local IP and MAC are detected on first use, constructing a scanner does no I/O
+        self._local = None
+        self._local_lock = threading.Lock()
+
+    @property
+    def oui(self):
+        # Vendor lookups come from a local OUI file, refreshed with scripts/update_oui.py
+        return get_oui_index()
+
+    @property
+    def classifier(self):
+        if self._classifier is None:
+            self._classifier = get_classifier()
+        return self._classifier
+
+    @property
+    def local_ip(self):
+        return self._detect_local()[0]
+
+    @property
+    def local_mac(self):
+        return self._detect_local()[1]
+
+    def _detect_local(self):
+        """Detect the local IP and MAC once, returns (ip, mac)"""
+        if self._local is None:
+            with self._local_lock:
+                if self._local is None:
+                    local = self.backend.local_address()
+                    if local is None:
+                        local_ip = self._get_local_ip()
+                        local_mac = self._get_local_mac(local_ip)
+                        # Fallback: get MAC from local interfaces if not found
+                        if local_ip and not local_mac:
+                            local_mac = self._get_interface_mac(local_ip)
+                        local = (local_ip, local_mac)
+                    self._local = local
+        return self._local
+
+    def _get_interface_mac(self, ip):
+        try:
+            import netifaces
+            for iface in netifaces.interfaces():
+                addrs = netifaces.ifaddresses(iface)
+                if netifaces.AF_INET in addrs:
+                    for addr in addrs[netifaces.AF_INET]:
+                        if addr.get('addr') == ip:
+                            mac = addrs.get(netifaces.AF_LINK, [{}])[0].get('addr')
+                            if mac:
+                                return mac
+        except ImportError:
+            print("Warning: netifaces not installed. Local MAC fallback unavailable.")
+        return None
 
     def _get_local_ip(self):
         try:
@@ -57,6 +257,8 @@ class NetworkScanner:
     def _get_local_mac(self, ip):
         if not ip:
             return None
+        if self.neighbors.refresh():
+            return self.neighbors.entries.get(ip)
         try:
             import platform
             system = platform.system().lower()
@@ -88,11 +290,17 @@ class NetworkScanner:
             return network
         except Exception as e:
             print(f"Could not detect network range: {e}")
-            return ipaddress.IPv4Network(self.network_range)
+            return ipaddress.IPv4Network(self.network_range, strict=False)
+
+    def _read_arp_entries(self):
+        """Read (ip, mac) pairs from the ARP table, loading the kernel table once per call"""
+        if self.neighbors.refresh():
+            return [(ip, mac) for ip, mac in self.neighbors.entries.items() if self._is_valid_ip(ip)]
+        return self._read_arp_command()
 
-    def scan_arp_table(self):
-        """Scan ARP table for connected devices"""
-        devices = []
+    def _read_arp_command(self):
+        """Read (ip, mac) pairs by parsing `arp -a` (platforms without a readable kernel table)"""
+        entries = []
         try:
             import platform
             system = platform.system().lower()
@@ -101,7 +309,7 @@ class NetworkScanner:
 
             if result.returncode != 0:
                 print(f"ARP command failed: {result.stderr}")
-                return devices
+                return entries
 
             # Parse ARP entries
             for line in result.stdout.split('\n'):
@@ -116,160 +324,88 @@ class NetworkScanner:
                         ip, mac = match.groups()
 
                 if match and self._is_valid_ip(ip):
-                    device_info = self._get_device_info(ip, mac, method='ARP')
-                    if device_info:
-                        devices.append(device_info)
+                    entries.append((ip, mac))
 
         except subprocess.TimeoutExpired:
             print("ARP scan timed out")
         except Exception as e:
             print(f"ARP scan failed: {e}")
 
-        return devices
-
-    def ping_sweep(self, network_range=None):
-        """Perform ping sweep to find active devices"""
-        if network_range is None:
-            network_range = self.get_local_network_range()
-
-        active_devices = []
-        threads = []
-
-        def ping_host(ip):
-            try:
-                import platform
-                system = platform.system().lower()
-
-                if system == 'windows':
-                    cmd = ['ping', '-n', '1', '-w', '1000', str(ip)]
-                else:
-                    cmd = ['ping', '-c', '1', '-W', '1', str(ip)]
-
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=3)
-
-                if result.returncode == 0:
-                    with self.scan_lock:
-                        device_info = self._get_device_info(str(ip), None, method='ping')
-                        if device_info:
-                            active_devices.append(device_info)
-
-            except Exception as e:
-                pass  # Ignore ping failures
-
-        for ip in network_range.hosts():
-            thread = threading.Thread(target=ping_host, args=(ip,))
-            threads.append(thread)
-            thread.start()
-
-            if len(threads) >= 50:
-                for t in threads:
-                    t.join()
-                threads = []
-
-        for thread in threads:
-            thread.join()
-
-        filtered_devices = [d for d in active_devices if d]
-        return filtered_devices
-
-    def port_scan(self, ip, ports=None):
-        """Scan common ports on a device"""
-        if ports is None:
-            ports = [22, 23, 24, 53, 80, 135, 139, 443, 445, 993, 995, 3000, 3389, 5050, 5060, 5900, 8080]
+        return entries
 
-        open_ports = []
+    def _get_device_info(self, ip, mac, method=None, known=None, refresh_intervals=None):
+        """Gather additional device information.
 
-        for port in ports:
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                result = sock.connect_ex((ip, port))
-                if result == 0:
-                    open_ports.append(port)
-                sock.close()
-            except Exception:
-                pass
-
-        return open_ports
-
-    def _get_device_info(self, ip, mac, method=None):
-        """Gather additional device information"""
+        known is the device's last stored state; fields it holds that are
+        still fresh for the same IP are reused instead of being looked up again.
+        refresh_intervals overrides Config.REFRESH_INTERVALS per field.
+        """
         try:
+            now = datetime.now()
+            fresh = self._fresh_fields(ip, known, now, refresh_intervals)
+            if 'hostname' in fresh:
+                hostname = known['hostname']
+                hostname_checked_at = known['hostname_checked_at']
+            else:
+                # A known device's name is due (or forced by a dns job), so skip the
+                # DNS cache; a PTR miss keeps a name the device announced (DHCP/mDNS)
+                hostname = self._get_hostname(ip, refresh=bool(known)) or (known or {}).get('hostname')
+                hostname_checked_at = now
+            vendor = self._get_vendor(mac)
             info = {
                 'ip': ip,
                 'mac': mac,
-                'hostname': self._get_hostname(ip),
-                'vendor': self._get_vendor(mac),
-                'device_type': self._classify_device(mac, ip),
-                'last_seen': datetime.now(),
+                'hostname': hostname,
+                'vendor': vendor,
+                'device_type': 'Unknown',
+                'last_seen': now,
                 'open_ports': [],
-                'method': method or 'unknown'
+                'method': method or 'unknown',
+                'hostname_checked_at': hostname_checked_at,
+                'ports_checked_at': None
             }
-
-            # Get open ports
-            info['open_ports'] = self.port_scan(ip)
+            if 'ports' in fresh:
+                info['open_ports'] = list(known['open_ports'])
+                info['ports_checked_at'] = known['ports_checked_at']
+            info['device_type'] = self._classify_device(
+                mac, ip, vendor=vendor, hostname=hostname, open_ports=info['open_ports']
+            )
+            # Otherwise open ports are filled in by the shared port stage in full_scan
             return info
         except Exception as e:
             print(f"Error getting device info for {ip}: {e}")
             return None
 
-    def _get_hostname(self, ip):
-        """Get hostname for IP address"""
-        try:
-            hostname = socket.gethostbyaddr(ip)[0]
-            return hostname
-        except:
-            return None
+    def _fresh_fields(self, ip, known, now, refresh_intervals=None):
+        """Names of enrichment fields in known that can be reused for this IP"""
+        if not known or known.get('ip_address') != ip:
+            # New device or a changed IP/MAC pair, enrich everything
+            return set()
+        intervals = dict(conf.REFRESH_INTERVALS, **(refresh_intervals or {}))
+        fresh = set()
+        for field, interval in intervals.items():
+            checked_at = known.get(f'{field}_checked_at')
+            if checked_at and (now - checked_at).total_seconds() < interval:
+                fresh.add(field)
+        return fresh
+
+    def _get_hostname(self, ip, refresh=False):
+        """Get hostname for IP address (cached across scans unless refresh)"""
+        return self.dns_cache.lookup(ip, refresh=refresh)
 
     def _get_vendor(self, mac):
         """Get vendor from MAC address"""
-        if not MAC_LOOKUP_AVAILABLE or not mac:
-            return None
-        try:
-            vendor = self.mac_lookup.lookup(mac)
-            return vendor
-        except:
-            return None
-
-    def _classify_device(self, mac, ip):
-        """Classify device type based on MAC vendor and other info"""
-        if not mac:
-            return 'Unknown'
-
-        vendor = self._get_vendor(mac)
-        hostname = self._get_hostname(ip)
-        if not vendor:
-            return 'Unknown'
-
-        # convert to lower to ensure no errors
-        vendor = vendor.lower()
-        hostname = hostname.lower()
+        return self.oui.lookup(mac)
 
+    def _classify_device(self, mac, ip, vendor=None, hostname=None, open_ports=None, services=None):
+        """Classify device type from the rules in Config.DEVICE_RULES_FILE"""
         # check for local IP and MAC
-        if ip == self.local_ip and mac == self.local_mac:
+        if mac and ip == self.local_ip and mac == self.local_mac:
             return 'This Device'
 
-        # Router/Gateway detection
-        if any(term in vendor for term in ['cisco', 'netgear', 'linksys', 'asus', 'tp-link', 'dlink', 'askey']):
-            return 'Router/Gateway'
-        if any(term in hostname for term in ['cisco', 'netgear', 'linksys', 'asus', 'tp-link', 'dlink', 'askey']):
-            return 'Router/Gateway'
-        # Mobile devices
-        if any(term in vendor for term in ['apple', 'samsung', 'lg electronics', 'htc', 'pixel']):
-            return 'Mobile Device'
-        if any(term in hostname for term in ['pixel', 'samsung', 'apple', 'iphone', 'htc']):
-            return 'Mobile Device'
-        # Computers
-        if any(term in vendor for term in ['dell', 'hp', 'lenovo', 'intel', 'asus', 'framework']):
-            return 'Computer'
-        if any(term in hostname for term in ['dell', 'hp', 'lenovo', 'intel', 'asus', 'framework']):
-            return 'Computer'
-        # IoT devices
-        if any(term in vendor for term in ['amazon', 'google', 'nest', 'philips', 'sonos', 'roku', 'tv', 'tcl']):
-            return 'IoT Device'
-        if any(term in hostname for term in ['amazon', 'google', 'nest', 'philips', 'sonos', 'roku', 'tv', 'tcl']):
-            return 'IoT Device'
-        return 'Unknown'
+        if vendor is None:
+            vendor = self._get_vendor(mac)
+        return self.classifier.classify(vendor, hostname, open_ports, services)
 
     def _is_valid_ip(self, ip):
         """Check if IP is valid and not a broadcast/network address"""
@@ -282,70 +418,395 @@ class NetworkScanner:
         except:
             return False
 
-    def full_scan(self):
-        """Perform a comprehensive network scan"""
+    def get_network_ranges(self, configured=None):
+        """Resolve the networks to scan.
+
+        An explicit setting wins, then Config.NETWORK_RANGE; "auto" (or nothing)
+        falls back to the detected local /24.
+        """
+        for value in (configured, self.network_range):
+            ranges = parse_network_ranges(value)
+            if ranges:
+                return ranges
+        return [self.get_local_network_range()]
+
+    def full_scan(self, known_devices=None, network_ranges=None, on_device=None, refresh_intervals=None):
+        """Perform a comprehensive network scan.
+
+        Runs as a pipeline: the discovery stages (ARP, ping) feed a queue that a
+        pool of enrichment workers drains, and enriched devices flow into a single
+        port-scan stage, so discovery, enrichment and port scans overlap.
+
+        network_ranges is a list (or comma separated string) of CIDRs. Ranges
+        bigger than one shard are split into SCAN_SHARD_PREFIX sized shards that
+        are swept and enriched in parallel across SCAN_PROCESSES processes.
+
+        known_devices maps MAC addresses to their last stored state (see
+        Device.get_known_state); when given, unchanged devices skip the
+        enrichment that is still fresh (incremental scan).
+
+        on_device(device_info) is called as soon as each device is fully
+        enriched; self.progress tracks probes completed while the scan runs
+        and self.timings the seconds spent per phase of the local pipeline:
+        discovery is wall clock, enrichment, ports and merge are summed over
+        devices (they overlap each other).
+        refresh_intervals overrides Config.REFRESH_INTERVALS for this scan, e.g.
+        {'ports': 0} rescans every port while keeping fresh hostnames.
+        """
+        known_devices = known_devices or {}
         print("Starting network scan...")
         start_time = time.time()
 
-        all_devices = []
+        ranges = self.get_network_ranges(network_ranges)
+        shards = split_into_shards(ranges, conf.SCAN_SHARD_PREFIX)
+        sharded = conf.SCAN_PROCESSES > 1 and len(shards) > 1
+        shard_futures = []
+        shard_devices = []
+        shards_merged = threading.Condition()
+        merged_count = 0
+        registry = ScanRegistry()
+        self.progress.start(sum(network.num_addresses for network in ranges))
+        self.timings = {}
+
+        # IPv6 can't be swept, a few multicast packets plus the neighbor cache give the addresses by MAC.
+        # That runs alongside IPv4 discovery; devices wait for it only once their ports are scanned
+        ipv6_discovery = Future()
+        if conf.IPV6_DISCOVERY:
+            threading.Thread(target=self._discover_ipv6_into, args=(ipv6_discovery,), daemon=True).start()
+        else:
+            ipv6_discovery.set_result({})
+
+        def shard_done(shard, skipped, future):
+            nonlocal merged_count
+            try:
+                try:
+                    devices = future.result()
+                except Exception as e:
+                    print(f"Shard scan failed: {e}")
+                    devices = []
+                merge_start = time.perf_counter()
+                # Shards never probe an IP the registry held, but a MAC can still turn up twice
+                devices = [
+                    device_info for device_info in devices
+                    if registry.observe(device_info['ip'], device_info.get('mac'), device_info.get('method'))
+                ]
+                for device_info in devices:
+                    device_info['ipv6_addresses'] = ipv6_discovery.result().get(device_info.get('mac'), [])
+                with self.scan_lock:
+                    shard_devices.extend(devices)
+                self._add_timing('merge', time.perf_counter() - merge_start)
+                self.progress.add_probed(shard.num_addresses - skipped)
+                self.progress.add_found(len(devices))
+                if on_device:
+                    for device_info in devices:
+                        self._notify(on_device, device_info)
+            finally:
+                # Futures wake wait() before running their callbacks, so the merge signals its own end
+                with shards_merged:
+                    merged_count += 1
+                    shards_merged.notify_all()
+
+        def in_ranges(ip):
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                return False
+            return any(address in network for network in ranges)
+
+        def discover(submit, registry):
+            # ARP scan, limited to the requested ranges like the ping sweep
+            print("Scanning ARP table...")
+            for ip, mac in self._read_arp_entries():
+                if in_ranges(ip):
+                    submit(ip, mac, 'ARP')
+
+            # The local device never shows up in its own ARP table
+            if self.local_ip and self.local_mac and in_ranges(self.local_ip):
+                submit(self.local_ip, self.local_mac, 'local')
+
+            # Ping sweep, skipping hosts ARP already reported and each range's
+            # network/broadcast address (shards sweep every address they hold)
+            skip = set(registry.ips())
+            if self.local_ip:
+                skip.add(self.local_ip)
+            for network in ranges:
+                if network.prefixlen < 31:
+                    skip.update((str(network.network_address), str(network.broadcast_address)))
+            skip_addresses = [ipaddress.IPv4Address(ip) for ip in skip]
+            if sharded:
+                print(f"Sweeping {len(shards)} shards across {conf.SCAN_PROCESSES} processes...")
+                pool = self._get_process_pool()
+                for shard in shards:
+                    skipped = sum(1 for address in skip_addresses if address in shard)
+                    self.progress.add_probed(skipped)
+                    future = pool.submit(scan_shard, str(shard), skip, known_devices, refresh_intervals,
+                                         None if self.backend is system_backend else self.backend)
+                    future.add_done_callback(functools.partial(shard_done, shard, skipped))
+                    shard_futures.append(future)
+            else:
+                self.progress.add_probed(sum(
+                    1 for address in skip_addresses if any(address in network for network in ranges)
+                ))
+                print("Performing ping sweep...")
+                self._ping_discover(ranges, skip, submit)
+
+        try:
+            all_devices = self._run_pipeline(discover, known_devices, on_device, refresh_intervals,
+                                             registry, ipv6_discovery)
+
+            # Merge shard results once every shard_done has finished; shards skipped
+            # every IP the local pipeline handled
+            with shards_merged:
+                shards_merged.wait_for(lambda: merged_count == len(shard_futures))
+            all_devices.extend(shard_devices)
+
+            # Hosts only reachable over IPv6 are enriched once every IPv4 MAC is known
+            ipv6_only = {
+                mac: addresses for mac, addresses in ipv6_discovery.result().items()
+                if mac not in registry.by_mac and mac != self.local_mac
+            }
+            if ipv6_only:
+                def discover_ipv6_only(submit, registry):
+                    for mac, addresses in ipv6_only.items():
+                        submit(addresses[0], mac, 'IPv6')
 
-        # ARP scan
-        print("Scanning ARP table...")
-        arp_devices = self.scan_arp_table()
-        all_devices.extend(arp_devices)
-
-        # Ping sweep
-        print("Performing ping sweep...")
-        ping_devices = self.ping_sweep()
-
-        # Merge devices (avoid duplicates by IP)
-        existing_ips = {device['ip'] for device in all_devices}
-        for device in ping_devices:
-            if device['ip'] not in existing_ips:
-                all_devices.append(device)
-
-        # Enhance devices found via ping with ARP info
-        for device in all_devices:
-            if device['mac'] is None and device['method'] == 'ping':
-                mac = self._get_mac_from_arp(device['ip'])
-                if mac != None:
-                    device['mac'] = mac
-                    device['vendor'] = self._get_vendor(mac)
-                    device['device_type'] = self._classify_device(mac, device['ip'])
-
-        # Remove any local device entries without a MAC (from ping/ARP)
-        all_devices = [d for d in all_devices if not (d['ip'] == self.local_ip and not d.get('mac'))]
-
-        # If local device is not in the list, add it manually
-        local_present = any(d['ip'] == self.local_ip and d.get('mac') == self.local_mac for d in all_devices)
-        if self.local_ip and self.local_mac and not local_present:
-            local_info = self._get_device_info(self.local_ip, self.local_mac, method='local')
-            if local_info:
-                all_devices.append(local_info)
-
-        # Ensure local device is saved to the database with all info, and remove any DB rows for local_ip with no MAC
-        if self.local_ip and self.local_mac:
-            from app.models import Device, DatabaseManager
-            # Remove DB rows for local_ip with no MAC
-            conn = DatabaseManager.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM devices WHERE ip_address = ? AND (mac_address IS NULL OR mac_address = '')", (self.local_ip,))
-            conn.commit()
-            conn.close()
-            local_info = self._get_device_info(self.local_ip, self.local_mac, method='local')
-            if local_info:
-                local_info['ip_address'] = local_info['ip']
-                local_info['mac_address'] = local_info['mac']
-                local_info['is_active'] = 1
-                Device.upsert(local_info)
+                all_devices.extend(self._run_pipeline(discover_ipv6_only, known_devices, on_device,
+                                                      refresh_intervals, registry, ipv6_discovery))
+        finally:
+            self.progress.finish()
 
         scan_duration = time.time() - start_time
         print(f"Scan completed in {scan_duration:.2f} seconds. Found {len(all_devices)} devices.")
 
         return all_devices, scan_duration
 
+    def scan_range(self, network, skip_ips=(), known_devices=None, refresh_intervals=None):
+        """Ping sweep and enrich every address of a network (one shard of a larger scan)"""
+        skip_ips = set(skip_ips)
+
+        def discover(submit, registry):
+            self._ping_discover([network], skip_ips, submit)
+
+        return self._run_pipeline(discover, known_devices or {}, refresh_intervals=refresh_intervals)
+
+    def _discover_ipv6_into(self, future):
+        """Run discover_ipv6 in the background, an empty map when it fails"""
+        try:
+            future.set_result(self.discover_ipv6())
+        except Exception as e:
+            print(f"IPv6 discovery failed: {e}")
+            future.set_result({})
+
+    def discover_ipv6(self):
+        """Map MAC addresses to IPv6 addresses, global ones first.
+
+        Sends one all-nodes echo per interface so quiet dual-stack hosts show
+        up in the kernel's IPv6 neighbor cache, then reads that cache.
+        """
+        try:
+            responders = asyncio.run(self.backend.solicit_all_nodes(conf.IPV6_PROBE_TIMEOUT))
+        except Exception as e:
+            print(f"IPv6 multicast probe failed: {e}")
+            responders = {}
+        table = self.backend.neighbor_table(socket.AF_INET6) or {}
+
+        by_mac = {}
+        for ip, mac in table.items():
+            try:
+                address = ipaddress.IPv6Address(ip)
+            except ValueError:
+                continue
+            if not address.is_multicast and not address.is_unspecified:
+                by_mac.setdefault(mac, []).append(address)
+        if responders or by_mac:
+            print(f"IPv6 discovery: {len(responders)} multicast replies, {len(by_mac)} neighbors")
+        return {
+            mac: [str(address) for address in sorted(addresses, key=lambda a: (a.is_link_local, a))]
+            for mac, addresses in by_mac.items()
+        }
+
+    def _ping_discover(self, ranges, skip, submit):
+        """Ping every address of the given networks, submitting the ones that answer"""
+        hosts = (
+            ip for network in ranges for ip in map(str, network)
+            if ip not in skip
+        )
+        try:
+            asyncio.run(ping_hosts(
+                hosts,
+                concurrency=conf.MAX_PING_THREADS,
+                timeout=conf.PING_TIMEOUT,
+                rtt=self.rtt,
+                pacer=self.pacer,
+                retries=conf.PROBE_RETRIES,
+                ping=self.backend.ping,
+                on_alive=lambda ip, rtt: submit(ip, None, 'ping'),
+                on_probe=lambda ip, rtt: self.progress.add_probed()
+            ))
+        except Exception as e:
+            print(f"Ping sweep failed: {e}")
+
+    def _run_pipeline(self, discover, known_devices, on_device=None, refresh_intervals=None, registry=None,
+                      ipv6_discovery=None):
+        """Run discover(submit, registry) through the enrichment and port stages.
+
+        Every sighting goes through the ScanRegistry, only hosts it has not
+        seen before are enriched. Returns the list of fully enriched devices,
+        passing each one to on_device as soon as it is done. ipv6_discovery
+        is a Future of discover_ipv6's map, which fills in each device's IPv6
+        addresses; devices wait for it after their port scan.
+        """
+        if ipv6_discovery is None:
+            ipv6_discovery = Future()
+            ipv6_discovery.set_result({})
+        # Pick up edits to the rules file between scans
+        self._classifier = get_classifier()
+        registry = registry if registry is not None else ScanRegistry()
+        all_devices = []
+        discovered = queue.Queue()
+        enriched = queue.Queue()
+
+        def submit(ip, mac, method):
+            merge_start = time.perf_counter()
+            record = registry.observe(ip, mac, method)
+            self._add_timing('merge', time.perf_counter() - merge_start)
+            if record is not None:
+                discovered.put(record)
+
+        def enrichment_worker():
+            while True:
+                record = discovered.get()
+                if record is None:
+                    break
+                ip, mac, method = record['ip'], record['mac'], record['methods'][0]
+                enrich_start = time.perf_counter()
+                try:
+                    # Devices found by ping only get their MAC from the ARP table
+                    if mac is None and method == 'ping':
+                        mac = self._get_mac_from_arp(ip)
+                        if mac and not registry.claim_mac(record, mac):
+                            continue  # the same device was already found at another address
+                    device_info = self._get_device_info(
+                        ip, mac, method=method, known=known_devices.get(mac),
+                        refresh_intervals=refresh_intervals
+                    )
+                    if device_info:
+                        enriched.put(device_info)
+                except Exception as e:
+                    print(f"Enrichment failed for {ip}: {e}")
+                finally:
+                    self._add_timing('enrichment', time.perf_counter() - enrich_start)
+
+        def collect(device_info):
+            # Classify again now that the open ports are known
+            device_info['device_type'] = self._classify_device(
+                device_info['mac'], device_info['ip'],
+                vendor=device_info['vendor'],
+                hostname=device_info['hostname'],
+                open_ports=device_info['open_ports'],
+                services=device_info.get('services')
+            )
+            device_info['methods'] = registry.methods(device_info['ip'])
+            device_info['ipv6_addresses'] = ipv6_discovery.result().get(device_info['mac'], [])
+            with self.scan_lock:
+                all_devices.append(device_info)
+            self.progress.add_found()
+            if on_device:
+                self._notify(on_device, device_info)
+
+        workers = [
+            threading.Thread(target=enrichment_worker, daemon=True)
+            for _ in range(max(1, conf.ENRICHMENT_WORKERS))
+        ]
+        for worker in workers:
+            worker.start()
+        port_stage = threading.Thread(
+            target=lambda: asyncio.run(self._port_stage(enriched, collect, ipv6_discovery)),
+            daemon=True
+        )
+        port_stage.start()
+
+        discovery_start = time.perf_counter()
+        try:
+            discover(submit, registry)
+        finally:
+            self._add_timing('discovery', time.perf_counter() - discovery_start)
+            for _ in workers:
+                discovered.put(None)
+            for worker in workers:
+                worker.join()
+            enriched.put(None)
+            port_stage.join()
+
+        return all_devices
+
+    def _add_timing(self, phase, seconds):
+        with self.scan_lock:
+            self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    def _notify(self, on_device, device_info):
+        try:
+            on_device(device_info)
+        except Exception as e:
+            print(f"Device callback failed for {device_info.get('ip')}: {e}")
+
+    def _get_process_pool(self):
+        """Process pool for shard scans, created on first use and kept across scans"""
+        if self._process_pool is None:
+            # spawn: forking a process full of scan and web threads is not safe
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=conf.SCAN_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._process_pool
+
+    async def _port_stage(self, devices_in, on_done, ready=None):
+        """Port-scan and fingerprint devices as they arrive, sharing one pool of in-flight connections
+
+        on_done(device_info) is called once the device is scanned and the
+        concurrent.futures.Future ready (if any) has finished.
+        """
+        loop = asyncio.get_running_loop()
+        limiter = asyncio.Semaphore(conf.MAX_PORT_SCAN_CONNECTIONS)
+        tasks = []
+
+        async def scan(device_info):
+            port_start = time.perf_counter()
+            try:
+                # Ports reused from an incremental scan already carry their check time
+                if device_info.get('ports_checked_at') is None:
+                    device_info['open_ports'] = await scan_host_ports(
+                        device_info['ip'], conf.PORT_SCAN_PORTS, limiter, conf.PORT_SCAN_TIMEOUT,
+                        rtt=self.rtt, pacer=self.pacer, retries=conf.PROBE_RETRIES,
+                        connect=self.backend.connect
+                    )
+                    device_info['ports_checked_at'] = datetime.now()
+                if conf.SERVICE_FINGERPRINT:
+                    device_info['services'] = await fingerprint_services(
+                        device_info['ip'], device_info['mac'], device_info['open_ports'], limiter,
+                        cache=self.service_cache, timeout=conf.SERVICE_FINGERPRINT_TIMEOUT, pacer=self.pacer,
+                        fingerprint=self.backend.fingerprint
+                    )
+            except Exception as e:
+                print(f"Port scan failed for {device_info['ip']}: {e}")
+            self._add_timing('ports', time.perf_counter() - port_start)
+            if ready is not None:
+                await asyncio.wrap_future(ready)
+            on_done(device_info)
+
+        while True:
+            device_info = await loop.run_in_executor(None, devices_in.get)
+            if device_info is None:
+                break
+            tasks.append(asyncio.create_task(scan(device_info)))
+        await asyncio.gather(*tasks)
+
     def _get_mac_from_arp(self, ip):
         """Get MAC address from ARP table for specific IP"""
+        if self.neighbors.supported is not False:
+            mac = self.neighbors.get(ip)
+            if self.neighbors.supported:
+                return mac
         try:
             import platform
             system = platform.system().lower()
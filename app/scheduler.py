@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# this file runs recurring scan jobs, each with its own cadence per subnet
+
+NEVER = float('inf')
+
+# Enrichment each job kind forces or skips for devices that are already known,
+# passed to NetworkScanner.full_scan as refresh_intervals. New devices are
+# always fully enriched.
+JOB_REFRESH_INTERVALS = {
+    'discovery': {'hostname': NEVER, 'ports': NEVER},
+    'dns': {'hostname': 0, 'ports': NEVER},
+    'ports': {'hostname': NEVER, 'ports': 0},
+}
+
+# Cheap jobs run first when several are due at the same time
+JOB_PRIORITY = {'discovery': 0, 'dns': 1, 'ports': 2}
+
+
+class ScanJob:
+    """One recurring scan of a subnet"""
+
+    def __init__(self, kind, network_range, interval):
+        self.kind = kind
+        self.network_range = network_range
+        self.interval = interval
+        self.next_run = None
+        self.last_run = None
+        self.last_duration = None
+        self.skipped = 0
+
+    @property
+    def key(self):
+        return (self.kind, self.network_range)
+
+    @property
+    def refresh_intervals(self):
+        return JOB_REFRESH_INTERVALS.get(self.kind)
+
+
+class ScanScheduler:
+    """Runs scan jobs from a priority queue ordered by next run time.
+
+    load_jobs() returns {(kind, network_range): interval_seconds} and is called
+    on every tick, so setting changes apply without a restart. run_job(job)
+    performs one scan and returns False when it could not start (for example
+    because another scan is running), in which case it is retried next tick.
+    """
+
+    def __init__(self, load_jobs, run_job, jitter=0.1, tick=5):
+        self.load_jobs = load_jobs
+        self.run_job = run_job
+        self.jitter = jitter
+        self.tick = tick
+        self.jobs = {}
+        self._queue = []
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _jittered(self, interval):
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _schedule(self, job, when):
+        job.next_run = when
+        heapq.heappush(self._queue, (when, JOB_PRIORITY.get(job.kind, 99), next(self._counter), job))
+
+    def sync(self, now=None):
+        """Reload the job definitions, adding, retiming and dropping jobs"""
+        now = time.time() if now is None else now
+        wanted = self.load_jobs()
+
+        for key in list(self.jobs):
+            if key not in wanted:
+                # Its queue entry is discarded when it comes up
+                del self.jobs[key]
+
+        for key, interval in wanted.items():
+            job = self.jobs.get(key)
+            if job is None:
+                job = self.jobs[key] = ScanJob(key[0], key[1], interval)
+                # Spread the first runs out instead of starting every job at once
+                self._schedule(job, now + random.uniform(0, self.jitter * interval))
+            elif job.interval != interval:
+                job.interval = interval
+                if job.next_run > now + interval:
+                    self._schedule(job, now + self._jittered(interval))
+
+    def run_pending(self, now=None):
+        """Run every job that is due, returns the number of jobs run"""
+        ran = 0
+        now = time.time() if now is None else now
+        while self._queue and self._queue[0][0] <= now and not self._stop.is_set():
+            when, _, _, job = heapq.heappop(self._queue)
+            if self.jobs.get(job.key) is not job or job.next_run != when:
+                continue  # dropped or rescheduled since it was queued
+
+            started = time.time()
+            if self.run_job(job) is False:
+                self._schedule(job, started + self.tick)
+                continue
+            ran += 1
+            finished = time.time()
+            job.last_run = started
+            job.last_duration = finished - started
+
+            next_run = when + self._jittered(job.interval)
+            if next_run <= finished:
+                # The job overran or waited behind another one, skip the missed runs instead of piling up
+                missed = int((finished - next_run) // job.interval) + 1
+                job.skipped += missed
+                print(f"Scan job {job.kind} for {job.network_range} fell behind, skipping {missed} run(s)")
+                next_run = finished + self._jittered(job.interval)
+            self._schedule(job, next_run)
+            now = time.time()
+        return ran
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+                self.run_pending()
+            except Exception as e:
+                print(f"Scheduler error: {e}")
+            self._stop.wait(self.tick)
+
+    def start(self):
+        """Start the scheduler in a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,180 @@
+import asyncio
+import ipaddress
+import random
+import socket
+import threading
+import time
+
+from app.probes import ProbeBackend
+
+# this file simulates a network so scans can be benchmarked without a LAN
+
+# Open port -> share of hosts that have it open
+DEFAULT_PORTS = {22: 0.3, 80: 0.4, 139: 0.05, 443: 0.25, 445: 0.1, 3389: 0.05, 8080: 0.1, 9100: 0.03}
+
+# What each simulated service answers to the fingerprint stage
+SERVICES = {
+    22: ('ssh', 'SSH-2.0-OpenSSH_9.6p1'),
+    80: ('http', 'nginx/1.24.0'),
+    443: ('https', 'nginx/1.24.0'),
+    8080: ('http', 'lighttpd/1.4.59'),
+    9100: ('banner', 'HP JetDirect'),
+}
+
+# OUI prefixes (with their real vendors) and hostname stems the devices are drawn from
+OUIS = ['f0:18:98', '3c:5a:b4', 'b8:27:eb', '00:50:56', 'a4:5e:60', '00:1b:63', 'fc:fb:fb', '00:17:88']
+HOSTNAMES = ['laptop', 'desktop', 'iphone', 'pixel', 'printer', 'nas', 'tv', 'camera', 'server']
+
+
+class SimulatedHost:
+    __slots__ = ('ip', 'mac', 'rtt', 'hostname', 'open_ports', 'in_arp', 'filtered')
+
+    def __init__(self, ip, mac, rtt, hostname, open_ports, in_arp, filtered):
+        self.ip = ip
+        self.mac = mac
+        self.rtt = rtt
+        self.hostname = hostname
+        self.open_ports = open_ports
+        self.in_arp = in_arp
+        self.filtered = filtered
+
+
+class SimulatedNetwork(ProbeBackend):
+    """A synthetic network behind the ProbeBackend interface.
+
+    Each address's host (or its absence) is derived from (seed, ip), so the
+    same spec always gives the same network, a /16 costs nothing until it
+    is probed, and the backend pickles to shard processes as its spec.
+    Latency is a per-host RTT range in seconds, loss the share of probes
+    dropped, filtered_ratio the share of hosts that drop probes to closed
+    ports instead of resetting them. The first address of the first network
+    is the scanning host.
+    """
+
+    def __init__(self, networks='10.0.0.0/24', density=0.3, latency=(0.0005, 0.005), loss=0.0,
+                 ports=None, dns_ratio=0.6, arp_ratio=0.5, filtered_ratio=0.0, dns_latency=0.001, seed=1):
+        if isinstance(networks, str):
+            networks = [n.strip() for n in networks.split(',') if n.strip()]
+        self.spec = {
+            'networks': [str(ipaddress.IPv4Network(n, strict=False)) for n in networks],
+            'density': density,
+            'latency': tuple(latency),
+            'loss': loss,
+            'ports': dict(DEFAULT_PORTS if ports is None else ports),
+            'dns_ratio': dns_ratio,
+            'arp_ratio': arp_ratio,
+            'filtered_ratio': filtered_ratio,
+            'dns_latency': dns_latency,
+            'seed': seed,
+        }
+        self.networks = [ipaddress.IPv4Network(n) for n in self.spec['networks']]
+        first = self.networks[0]
+        self.local = (str(first.network_address + 1), '02:00:00:00:00:01')
+        self._hosts = {}
+        self._contacted = {}  # ip -> mac of hosts that answered, as the kernel would have learned them
+        self._arp_table = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return repr(sorted(self.spec.items()))
+
+    def __getstate__(self):
+        return self.spec
+
+    def __setstate__(self, spec):
+        self.__init__(**spec)
+
+    def _addresses(self):
+        for network in self.networks:
+            yield from map(str, network.hosts() if network.prefixlen < 31 else network)
+
+    def host(self, ip):
+        """The simulated host at an address, None when nothing lives there"""
+        if ip in self._hosts:
+            return self._hosts[ip]
+        host = None
+        address = ipaddress.IPv4Address(ip)
+        if ip != self.local[0] and any(
+            address in network and (network.prefixlen >= 31 or address not in (network.network_address,
+                                                                                 network.broadcast_address))
+            for network in self.networks
+        ):
+            spec = self.spec
+            rng = random.Random(f"{spec['seed']}:{ip}")
+            if rng.random() < spec['density']:
+                mac = rng.choice(OUIS) + ':' + ':'.join(f'{rng.randrange(256):02x}' for _ in range(3))
+                host = SimulatedHost(
+                    ip,
+                    mac,
+                    rng.uniform(*spec['latency']),
+                    f"{rng.choice(HOSTNAMES)}-{ip.replace('.', '-')}.sim.lan" if rng.random() < spec['dns_ratio'] else None,
+                    frozenset(port for port, share in sorted(spec['ports'].items()) if rng.random() < share),
+                    rng.random() < spec['arp_ratio'],
+                    rng.random() < spec['filtered_ratio']
+                )
+        self._hosts[ip] = host
+        return host
+
+    def hosts(self):
+        """Every simulated host, walking all addresses once"""
+        return [host for host in map(self.host, self._addresses()) if host is not None]
+
+    def _answer(self, host):
+        """Round trip of one probe to a host, None when the probe is lost"""
+        with self._lock:
+            if self.spec['loss'] and self._rng.random() < self.spec['loss']:
+                return None
+            jitter = self._rng.uniform(0.9, 1.1)
+            self._contacted[host.ip] = host.mac
+        return host.rtt * jitter
+
+    async def ping(self, ip, timeout, seq=1):
+        host = self.host(ip)
+        rtt = self._answer(host) if host else None
+        if rtt is None or rtt > timeout:
+            await asyncio.sleep(timeout)
+            return None
+        await asyncio.sleep(rtt)
+        return rtt
+
+    async def connect(self, ip, port, timeout):
+        host = self.host(ip)
+        rtt = self._answer(host) if host else None
+        if rtt is None or rtt > timeout or (host.filtered and port not in host.open_ports):
+            await asyncio.sleep(timeout)
+            return None, None
+        await asyncio.sleep(rtt)
+        return ('open' if port in host.open_ports else 'closed'), rtt
+
+    async def fingerprint(self, ip, port, timeout):
+        host = self.host(ip)
+        if host is None or port not in host.open_ports:
+            return None
+        await asyncio.sleep(min(timeout, host.rtt * 2))
+        service = SERVICES.get(port)
+        if service is None:
+            return None
+        return {'port': port, 'service': service[0], 'banner': service[1], 'cn': None}
+
+    async def solicit_all_nodes(self, timeout):
+        return {}
+
+    def neighbor_table(self, family=socket.AF_INET):
+        if family != socket.AF_INET:
+            return {}
+        if self._arp_table is None:
+            self._arp_table = {host.ip: host.mac for host in self.hosts() if host.in_arp}
+        with self._lock:
+            return dict(self._arp_table, **self._contacted)
+
+    def reverse_dns(self, ip):
+        time.sleep(self.spec['dns_latency'])
+        host = self.host(ip)
+        if host is None or host.hostname is None:
+            raise socket.herror(1, 'Unknown host')
+        return host.hostname
+
+    def local_address(self):
+        return self.local
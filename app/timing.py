@@ -0,0 +1,137 @@
+import asyncio
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config as conf
+
+# this file estimates round-trip times for probe timeouts and paces outgoing probes
+
+
+class RttEstimator:
+    """Smoothed RTT and RTT variance of one host or subnet, as TCP does it (RFC 6298)"""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    __slots__ = ('srtt', 'rttvar')
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+
+    def observe(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+    def timeout(self):
+        return self.srtt + 4 * self.rttvar
+
+
+class RttTable:
+    """Per-host and per-subnet RTT estimates that probe timeouts are derived from.
+
+    A host that answered before gets a timeout from its own estimate, an
+    unknown host one from its subnet's (which also absorbs the spread between
+    fast and slow hosts), and without either the caller's default is used.
+    Every retry doubles the timeout; results are clamped to
+    [min_timeout, max_timeout].
+    """
+
+    def __init__(self, min_timeout=0.05, max_timeout=3, subnet_prefix=24, max_hosts=65536):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.subnet_prefix = subnet_prefix
+        self.max_hosts = max_hosts
+        self._hosts = OrderedDict()  # ip -> RttEstimator
+        self._subnets = {}  # network -> RttEstimator
+        self._lock = threading.Lock()
+
+    def _subnet(self, ip):
+        address = ipaddress.ip_address(ip)
+        prefix = self.subnet_prefix if address.version == 4 else 64
+        return ipaddress.ip_network(f'{address}/{prefix}', strict=False)
+
+    def observe(self, ip, rtt):
+        """Record one measured round trip in seconds"""
+        subnet = self._subnet(ip)
+        with self._lock:
+            host = self._hosts.get(ip)
+            if host is None:
+                host = self._hosts[ip] = RttEstimator()
+                while len(self._hosts) > self.max_hosts:
+                    self._hosts.popitem(last=False)
+            else:
+                self._hosts.move_to_end(ip)
+            host.observe(rtt)
+            self._subnets.setdefault(subnet, RttEstimator()).observe(rtt)
+
+    def timeout(self, ip, attempt=0, default=1):
+        """Timeout in seconds for the given attempt (0 for the first try) at one host"""
+        with self._lock:
+            estimate = self._hosts.get(ip) or self._subnets.get(self._subnet(ip))
+            timeout = estimate.timeout() if estimate is not None else default
+        return min(self.max_timeout, max(self.min_timeout, timeout) * 2 ** attempt)
+
+    def snapshot(self):
+        """Smoothed RTT and timeout of every subnet, in milliseconds"""
+        with self._lock:
+            return {
+                str(subnet): {
+                    'srtt_ms': round(estimate.srtt * 1000, 3),
+                    'timeout_ms': round(min(self.max_timeout, max(self.min_timeout, estimate.timeout())) * 1000, 3)
+                }
+                for subnet, estimate in self._subnets.items()
+            }
+
+
+def probe_timeout(rtt, ip, attempt, default):
+    """Timeout for one probe attempt, from the RttTable when there is one"""
+    if rtt is not None:
+        return rtt.timeout(ip, attempt, default)
+    return default * 2 ** attempt
+
+
+class TokenBucket:
+    """Token bucket pacing every probe the process sends, shared across threads and event loops.
+
+    rate is in packets per second (0 disables pacing) and burst is how many
+    packets may go out back to back after an idle period.
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst=None):
+        with self._lock:
+            self.rate = rate
+            self.burst = max(1, burst if burst is not None else rate / 10)
+            self._tokens = self.burst
+            self._updated = time.monotonic()
+
+    def reserve(self, count=1):
+        """Take count tokens, returns how many seconds to wait before sending"""
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative: later callers queue up behind the reservations already made
+            self._tokens -= count
+            return max(0, -self._tokens / self.rate)
+
+    async def acquire(self, count=1):
+        delay = self.reserve(count)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Shared by every scan in the process
+probe_pacer = TokenBucket(conf.PROBE_RATE, conf.PROBE_BURST)
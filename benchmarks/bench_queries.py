@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Query benchmark for Network Dashboard
+Times the dashboard's hot queries against databases of growing size and
+checks that their cost stays flat as the devices and scan history grow
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from flask import Flask
+
+from app.models import DatabaseManager, Device, DeviceHistory, NetworkScan, Stats
+from database.init_db import create_schema, upgrade_database
+
+# Query name -> model call; each touches a bounded set of rows however large the tables get
+QUERIES = {
+    'get_active': lambda: Device.get_active(),
+    'mark_inactive': lambda: Device.mark_inactive(),
+    'recent_scans': lambda: NetworkScan.get_recent_scans(),
+    'dashboard_stats': lambda: Stats.get_dashboard_stats(),
+    'full_stats': lambda: Stats.full_dashboard_stats(),
+}
+# Queries that still read every row, reported but not checked
+UNBOUNDED = {'full_stats'}  # counts every device, only run by the consistency check
+
+INDEXES = ('idx_devices_active_last_seen', 'idx_devices_first_seen', 'idx_network_scans_scan_time')
+
+def populate(db_path, devices, active, new_today, seed=1):
+    """
+    Create a database with a year of history
+
+    Args:
+        db_path: Path of the database to create
+        devices: Number of devices, also the number of logged scans
+        active: Devices seen in the last few minutes
+        new_today: Devices first seen today
+
+    Returns:
+        None
+    """
+    rng = random.Random(seed)
+    # Stored timestamps are UTC, like CURRENT_TIMESTAMP
+    now = DeviceHistory.utcnow()
+    today = Stats.day_start()
+
+    def timestamp(value):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+
+    rows = []
+    for i in range(devices):
+        if i < new_today:
+            first_seen = today + timedelta(seconds=rng.randrange(max(1, int((now - today).total_seconds()))))
+        else:
+            first_seen = today - timedelta(days=rng.uniform(1, 365))
+        if i < active:
+            last_seen = now - timedelta(minutes=rng.uniform(0, 10))
+        else:
+            last_seen = max(first_seen, now - timedelta(days=rng.uniform(0.5, 30)))
+        rows.append((
+            f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}',
+            ':'.join(f'{b:02x}' for b in (2, 0, i >> 24 & 255, i >> 16 & 255, i >> 8 & 255, i & 255)),
+            timestamp(first_seen),
+            timestamp(last_seen),
+            1 if i < active else 0
+        ))
+    scans = [(timestamp(now - timedelta(minutes=i)), active, 1.5, 'full_scan') for i in range(devices)]
+
+    conn = sqlite3.connect(db_path)
+    create_schema(conn)
+    upgrade_database(conn)
+    conn.executemany("""
+        INSERT INTO devices (ip_address, mac_address, first_seen, last_seen, is_active, open_ports)
+        VALUES (?, ?, ?, ?, ?, '[]')
+    """, rows)
+    conn.executemany("""
+        INSERT INTO network_scans (scan_time, devices_found, scan_duration, scan_method)
+        VALUES (?, ?, ?, ?)
+    """, scans)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def time_queries(db_path, repeat, without_indexes=False):
+    """
+    Time every query in QUERIES
+
+    Args:
+        db_path: Database to query
+        repeat: Timed calls per query
+        without_indexes: Drop the dashboard indexes first, for comparison
+
+    Returns:
+        dict: Median seconds per query
+    """
+    if without_indexes:
+        conn = sqlite3.connect(db_path)
+        for index in INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.commit()
+        conn.close()
+
+    app = Flask(__name__)
+    app.config['DATABASE_PATH'] = db_path
+    results = {}
+    with app.app_context():
+        for name, query in QUERIES.items():
+            query()  # warm the connection pool and page cache
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - start)
+            results[name] = statistics.median(timings)
+    DatabaseManager.close_all()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard Query Benchmark')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated device counts to test')
+    parser.add_argument('--active', type=int, default=100, help='Devices seen in the last few minutes')
+    parser.add_argument('--new-today', type=int, default=20, help='Devices first seen today')
+    parser.add_argument('--repeat', type=int, default=50, help='Timed calls per query and size')
+    parser.add_argument('--without-indexes', action='store_true', help='Drop the dashboard indexes to compare')
+    parser.add_argument('--max-growth', type=float, default=3.0,
+                       help='Fail when a query is this many times slower at the largest size than at the smallest')
+
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            populate(db_path, size, min(args.active, size), min(args.new_today, size))
+            results[size] = time_queries(db_path, args.repeat, args.without_indexes)
+
+    print(f"{'query':<16}" + ''.join(f"{size:>12,}" for size in sizes) + '   growth')
+    failed = False
+    for name in QUERIES:
+        timings = [results[size][name] for size in sizes]
+        growth = timings[-1] / timings[0] if timings[0] else 0
+        checked = name not in UNBOUNDED
+        print(f"{name:<16}" + ''.join(f"{value * 1000:10.3f}ms" for value in timings) +
+              f"   {growth:5.1f}x" + ('' if checked else '  (not checked)'))
+        if checked and growth > args.max_growth:
+            print(f"  {name} grows with the table size ({growth:.1f}x)")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Scan benchmark for Network Dashboard
+Runs full_scan against simulated networks (app/simulator.py) and times its
+discovery, enrichment, port, merge and database write phases
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from flask import Flask
+
+from config import Config
+from app.models import DatabaseManager, Device
+from app.scanner import NetworkScanner
+from app.simulator import SimulatedNetwork
+from app.timing import probe_pacer
+from database.init_db import create_schema, upgrade_database
+
+PHASES = ('total', 'discovery', 'enrichment', 'ports', 'merge', 'db_write')
+DEFAULT_BASELINE = PROJECT_ROOT / 'benchmarks' / 'scan_baseline.json'
+
+def write_devices(devices):
+    """
+    Store scan results in a fresh database the way the web process does
+
+    Args:
+        devices: Devices returned by full_scan
+
+    Returns:
+        float: Seconds spent in Device.bulk_upsert
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        create_schema(conn)
+        upgrade_database(conn)
+        conn.close()
+
+        app = Flask(__name__)
+        app.config['DATABASE_PATH'] = db_path
+        rows = [dict(device, ip_address=device['ip'], mac_address=device['mac']) for device in devices]
+        with app.app_context():
+            start = time.perf_counter()
+            Device.bulk_upsert(rows)
+            elapsed = time.perf_counter() - start
+            DatabaseManager.close_all()
+            return elapsed
+
+def run_once(prefix, args):
+    """
+    Scan one simulated network with a cold scanner
+
+    Args:
+        prefix: Prefix length of the simulated 10.0.0.0 network
+        args: Parsed command line arguments
+
+    Returns:
+        dict: Seconds per phase, plus the devices found and expected
+    """
+    cidr = f'10.0.0.0/{prefix}'
+    network = SimulatedNetwork(
+        cidr,
+        density=args.density,
+        latency=(args.min_latency / 1000, args.max_latency / 1000),
+        loss=args.loss,
+        filtered_ratio=args.filtered,
+        seed=args.seed
+    )
+    expected = len(network.hosts()) + 1  # plus the scanning host
+    scanner = NetworkScanner(backend=network)
+    devices, duration = scanner.full_scan(network_ranges=cidr)
+    result = {phase: scanner.timings.get(phase, 0.0) for phase in PHASES}
+    result['total'] = duration
+    result['db_write'] = write_devices(devices)
+    result['found'] = len(devices)
+    result['expected'] = expected
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard Scan Benchmark')
+    parser.add_argument('--sizes', default='24,20', help='Comma separated prefix lengths to simulate, e.g. 24,20,16')
+    parser.add_argument('--runs', type=int, default=3, help='Scans per size')
+    parser.add_argument('--density', type=float, default=0.3, help='Share of addresses with a host')
+    parser.add_argument('--min-latency', type=float, default=0.5, help='Fastest host RTT in ms')
+    parser.add_argument('--max-latency', type=float, default=5, help='Slowest host RTT in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='Share of probes dropped')
+    parser.add_argument('--filtered', type=float, default=0.0, help='Share of hosts dropping probes to closed ports')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the simulated network')
+    parser.add_argument('--processes', type=int, default=1,
+                       help='SCAN_PROCESSES for the scan (phases only cover the local pipeline when above 1)')
+    parser.add_argument('--probe-rate', type=float, default=0, help='PROBE_RATE for the scan, 0 for no pacing')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Write this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                       help='Fail when a phase is slower than the baseline by more than this fraction')
+
+    args = parser.parse_args()
+
+    Config.SCAN_PROCESSES = args.processes
+    Config.PROBE_RATE = args.probe_rate
+    Config.IPV6_DISCOVERY = False
+    probe_pacer.configure(args.probe_rate, Config.PROBE_BURST)
+
+    results = {}
+    failed = False
+    for prefix in (int(size) for size in args.sizes.split(',')):
+        runs = [run_once(prefix, args) for _ in range(args.runs)]
+        medians = {phase: statistics.median(run[phase] for run in runs) for phase in PHASES}
+        results[f'/{prefix}'] = medians
+        found, expected = runs[-1]['found'], runs[-1]['expected']
+        print(f"/{prefix}: {found}/{expected} devices, median of {args.runs} runs")
+        for phase in PHASES:
+            print(f"  {phase:<11} {medians[phase] * 1000:10.1f} ms")
+        if found != expected:
+            print(f"  Found {found} devices, the simulated network has {expected}")
+            failed = True
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+        print(f"Baseline saved to {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        for size, medians in results.items():
+            for phase, value in medians.items():
+                reference = baseline.get(size, {}).get(phase)
+                # Phases that take next to no time are too noisy to compare
+                if reference and reference > 0.01 and value > reference * (1 + args.threshold):
+                    print(f"Regression: {size} {phase} took {value * 1000:.1f} ms, "
+                          f"baseline {reference * 1000:.1f} ms")
+                    failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for Network Dashboard
+Times a cold import of the app plus create_app() in fresh interpreters and
+checks that startup does no network I/O and spawns no processes
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Runs in a fresh interpreter: records sockets and processes opened during startup
+CHILD = r'''
+import json, socket, subprocess, sys, time
+activity = []
+
+def guard(owner, name):
+    original = getattr(owner, name)
+    def wrapper(*args, **kwargs):
+        activity.append(f"{owner.__name__}.{name}{args[1:2] if owner is socket.socket else args[:1]}")
+        return original(*args, **kwargs)
+    setattr(owner, name, wrapper)
+
+for name in ('connect', 'connect_ex', 'sendto'):
+    guard(socket.socket, name)
+guard(socket, 'getaddrinfo')
+guard(socket, 'gethostbyaddr')
+guard(subprocess.Popen, '__init__')
+
+start = time.perf_counter()
+from app import create_app
+import_time = time.perf_counter() - start
+create_app()
+total = time.perf_counter() - start
+print(json.dumps({'import': import_time, 'total': total, 'activity': activity}))
+'''
+
+def run_once():
+    """
+    Start the app in a fresh interpreter
+
+    Returns:
+        dict: import and total seconds plus any network/process activity seen
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard Startup Benchmark')
+    parser.add_argument('--runs', type=int, default=5, help='Number of cold starts to time')
+    parser.add_argument('--threshold', type=float, default=1.0,
+                       help='Fail when the median create_app() startup exceeds this many seconds')
+
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    totals = [run['total'] for run in runs]
+    imports = [run['import'] for run in runs]
+    activity = sorted({item for run in runs for item in run['activity']})
+
+    print(f"import app:        median {statistics.median(imports) * 1000:.0f} ms")
+    print(f"import + create:   median {statistics.median(totals) * 1000:.0f} ms "
+          f"(min {min(totals) * 1000:.0f}, max {max(totals) * 1000:.0f}, {args.runs} runs)")
+
+    failed = False
+    if activity:
+        print("Startup did network or process I/O:")
+        for item in activity:
+            print(f"  {item}")
+        failed = True
+    if statistics.median(totals) > args.threshold:
+        print(f"Startup is slower than {args.threshold:.2f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
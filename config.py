@@ -3,9 +3,69 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'network.db')
-    SCAN_INTERVAL = 10 
-    NETWORK_RANGE = '10.218.57.85/24'  # Adjust for your network
+    DB_READ_POOL_SIZE = 8  # idle read connections kept open per database
+    DB_BUSY_TIMEOUT = 5  # seconds a connection waits for a lock held by another process
+    DB_CACHE_SIZE_KB = 16384  # page cache of each connection
+    DB_MMAP_SIZE = 256 * 1024 * 1024  # bytes of the database file read through mmap
+    DB_STATEMENT_CACHE_SIZE = 256  # prepared statements cached per connection
+    DB_WRITE_BATCH_SIZE = 500  # scan results stored per transaction
+    DB_WRITE_INTERVAL = 1  # max seconds a scan result waits for its batch to fill
+    # Presence history (DeviceHistory): raw events plus hourly and daily uptime rollups
+    HISTORY_GAP = 600  # max seconds between two sightings of a device that count as online in between
+    HISTORY_RETENTION_DAYS = 30  # raw device_history events
+    HISTORY_HOURLY_RETENTION_DAYS = 180
+    HISTORY_DAILY_RETENTION_DAYS = 0  # 0 keeps daily rollups forever
+    HISTORY_PRUNE_INTERVAL = 3600  # min seconds between retention runs
+    HISTORY_MAX_BUCKETS = 5000  # largest timeline the history API returns
+    STATS_CHECK_INTERVAL = 3600  # min seconds between checks of the dashboard counters against full queries
+    OUI_FILE = os.path.join(os.path.dirname(__file__), 'data', 'oui.txt')
+    DEVICE_RULES_FILE = os.path.join(os.path.dirname(__file__), 'app', 'device_rules.json')
+    SCAN_INTERVAL = 60  # seconds between discovery sweeps, the scan_interval setting overrides it
+    PORT_SCAN_INTERVAL = 3600  # seconds between port rescans of each subnet
+    DNS_REFRESH_INTERVAL = 86400  # seconds between hostname refreshes of each subnet
+    SCAN_JITTER = 0.1  # scheduled runs move by up to this fraction of their interval
+    SCHEDULER_TICK = 5  # seconds between scheduler checks for due jobs
+    NETWORK_RANGE = '10.218.57.85/24'  # Adjust for your network: comma separated CIDRs, or 'auto'
+    SCAN_SHARD_PREFIX = 24  # ranges larger than this are split into shards of this size
+    SCAN_PROCESSES = os.cpu_count() or 1  # processes sweeping shards in parallel
+    SCAN_PROGRESS_INTERVAL = 2  # seconds between scan_progress events
     DEBUG = True
-    MAX_PING_THREADS = 50
+    MAX_PING_THREADS = 50  # concurrent ping probes in flight
+    PROBE_RATE = 1000  # packets per second across every ping and connect probe, 0 for no limit
+    PROBE_BURST = None  # probes sent back to back after an idle period (default: a tenth of PROBE_RATE)
+    PROBE_RETRIES = 1  # extra tries for probes that timed out, each with twice the timeout
+    PROBE_MIN_TIMEOUT = 0.05  # bounds of the timeouts derived from measured RTTs
+    PROBE_MAX_TIMEOUT = 3
+    PING_TIMEOUT = 1  # until the host or its subnet has an RTT estimate
     ARP_TIMEOUT = 2
-    PORT_SCAN_TIMEOUT = 1
+    NEIGHBOR_REFRESH_INTERVAL = 1  # min seconds between neighbor table reloads on a miss
+    IPV6_DISCOVERY = True  # all-nodes multicast probe + IPv6 neighbor cache, correlated by MAC
+    IPV6_PROBE_TIMEOUT = 1  # seconds to collect multicast echo replies
+    # Passive discovery learns devices from ARP/DHCP/mDNS/SSDP traffic (app/passive.py)
+    PASSIVE_INTERFACE = os.environ.get('PASSIVE_INTERFACE')  # capture interface, unset disables it
+    PASSIVE_PCAP = os.environ.get('PASSIVE_PCAP')  # replay a pcap file instead of capturing
+    PASSIVE_REFRESH_INTERVAL = 300  # min seconds between updates of an unchanged device
+    ENRICHMENT_WORKERS = 16  # threads doing DNS/vendor lookups while discovery runs
+    DNS_TIMEOUT = 2
+    DNS_CACHE_TTL = 86400  # seconds to keep a resolved hostname
+    DNS_NEGATIVE_TTL = 900  # seconds to remember hosts without a PTR record
+    DNS_CACHE_SIZE = 4096
+    DNS_WORKERS = 16
+    PORT_SCAN_TIMEOUT = 1  # until the host or its subnet has an RTT estimate
+    PORT_SCAN_PORTS = [22, 23, 24, 53, 80, 135, 139, 443, 445, 993, 995, 3000, 3389, 5050, 5060, 5900, 8080]
+    INCREMENTAL_SCAN = True  # skip enrichment that is still fresh for unchanged devices
+    REFRESH_INTERVALS = {
+        'hostname': 86400,  # re-resolve DNS daily
+        'ports': 3600  # re-scan ports hourly
+    }
+    MAX_PORT_SCAN_CONNECTIONS = 200  # shared across every (host, port) pair of a scan
+    SERVICE_FINGERPRINT = True  # read SSH/HTTP/TLS banners from open ports after the port scan
+    SERVICE_FINGERPRINT_TIMEOUT = 2
+    SERVICE_CACHE_TTL = 86400  # seconds before a (MAC, port) fingerprint is probed again
+    SERVICE_CACHE_SIZE = 16384
+    # Remote scan agents (agent.py) push their results to /api/ingest
+    AGENT_TOKENS = [token for token in os.environ.get('AGENT_TOKENS', '').split(',') if token]
+    AGENT_SERVER_URL = os.environ.get('AGENT_SERVER_URL', 'http://localhost:5000')
+    AGENT_TOKEN = os.environ.get('AGENT_TOKEN')
+    AGENT_BATCH_SIZE = 500  # devices per ingest request
+    INGEST_MAX_BYTES = 16 * 1024 * 1024  # largest decompressed ingest batch accepted
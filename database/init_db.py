@@ -1,24 +1,234 @@
 import sqlite3
 import os
+import sys
 
-def init_database():
-    """Initialize the network dashboard database"""
-    db_path = 'data/network.db'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+# Columns added after the first release, applied to databases created before them
+ADDED_COLUMNS = {
+    'devices': [
+        ('hostname_checked_at', 'DATETIME'),
+        ('ports_checked_at', 'DATETIME'),
+        ('ipv6_addresses', 'TEXT'),
+        ('services', 'TEXT'),
+    ],
+}
+
+def init_database(db_path=None):
+    """Initialize the network dashboard database, or bring an existing one up to the current schema"""
+    if db_path is None:
+        db_path = Config.DATABASE_PATH
 
     # Create data directory if it doesn't exist
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
-    # Read database schema
-    schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
-    with open(schema_path, 'r') as f:
-        schema = f.read()
-
     # Create database and tables
     conn = sqlite3.connect(db_path)
-    conn.executescript(schema)
+    create_schema(conn)
+    applied = upgrade_database(conn)
     conn.close()
 
+    if applied:
+        print(f"Applied database migrations: {', '.join(name for _, name in applied)}")
     print(f"Database initialized successfully at: {db_path}")
 
+def create_schema(conn):
+    """Create the tables of schema.sql that do not exist yet"""
+    schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
+    with open(schema_path, 'r') as f:
+        conn.executescript(f.read())
+
+def add_columns(conn):
+    """Add columns missing from databases created with an older schema"""
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+def key_macless_devices(conn):
+    """Key devices without a MAC address by IP address (Device.bulk_upsert)"""
+    merge_macless_devices(conn)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_devices_ip_without_mac
+        ON devices (ip_address) WHERE mac_address IS NULL
+    """)
+
+def merge_macless_devices(conn):
+    """Merge the duplicate rows older versions stored for devices without a MAC address
+
+    Keeps the newest row of each IP address with the earliest first_seen.
+    """
+    conn.execute("""
+        CREATE TEMP TABLE macless_merge AS
+        SELECT d.id AS old_id, k.keep_id, k.first_seen
+        FROM devices d
+        JOIN (
+            SELECT ip_address, MAX(id) AS keep_id, MIN(first_seen) AS first_seen
+            FROM devices WHERE mac_address IS NULL
+            GROUP BY ip_address HAVING COUNT(*) > 1
+        ) k ON d.ip_address = k.ip_address
+        WHERE d.mac_address IS NULL
+    """)
+    conn.execute("""
+        UPDATE device_history SET device_id = (SELECT keep_id FROM macless_merge WHERE old_id = device_id)
+        WHERE device_id IN (SELECT old_id FROM macless_merge)
+    """)
+    conn.execute("""
+        UPDATE devices SET first_seen = (SELECT first_seen FROM macless_merge WHERE keep_id = devices.id LIMIT 1)
+        WHERE id IN (SELECT keep_id FROM macless_merge)
+    """)
+    conn.execute("DELETE FROM devices WHERE id IN (SELECT old_id FROM macless_merge WHERE old_id != keep_id)")
+    conn.execute("DROP TABLE macless_merge")
+
+def index_dashboard_queries(conn):
+    """Covering indexes for the active device, new device and last scan queries"""
+    # get_active, mark_inactive and the active count filter on is_active and a last_seen range
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_active_last_seen ON devices (is_active, last_seen)")
+    # Devices first seen today
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_first_seen ON devices (first_seen)")
+    # Last scan and scan history, newest first
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_network_scans_scan_time ON network_scans (scan_time)")
+
+def add_presence_rollups(conn):
+    """Hourly and daily uptime rollups of device_history (DeviceHistory)"""
+    for table in ('device_presence_hourly', 'device_presence_daily'):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                device_id INTEGER NOT NULL,
+                bucket_start DATETIME NOT NULL,  -- UTC start of the hour or day
+                online_seconds REAL NOT NULL DEFAULT 0,
+                sightings INTEGER NOT NULL DEFAULT 0,
+                ip_changes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (device_id, bucket_start),
+                FOREIGN KEY (device_id) REFERENCES devices (id)
+            ) WITHOUT ROWID
+        """)
+        # Retention deletes by age
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket_start ON {table} (bucket_start)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_device_history_timestamp ON device_history (timestamp)")
+
+def add_dashboard_stats(conn):
+    """Persisted dashboard counters (Stats), filled from full queries on first use"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dashboard_stats (
+            name TEXT PRIMARY KEY,
+            value,  -- a count, or a timestamp for last_scan
+            period_start DATETIME  -- UTC start of the day new_today counts
+        )
+    """)
+
+def reset_default_network_range(conn):
+    """Point the network_range seeded by the first release at Config.NETWORK_RANGE
+
+    That release never read the setting, so its seeded value was never what
+    got scanned; 'auto' keeps scanning the configured or detected range.
+    """
+    conn.execute("""
+        UPDATE settings SET setting_value = 'auto', updated_at = CURRENT_TIMESTAMP
+        WHERE setting_name = 'network_range' AND setting_value = '192.168.1.0/24'
+    """)
+
+def add_device_source(conn):
+    """Record which scanner reports each device, '' for this server or 'agent:<name>'
+
+    Range resets only touch the reporting scanner's devices, and devices
+    without a MAC address are keyed by (source, ip_address), so agents on
+    sites with overlapping address ranges keep separate rows.
+    """
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(devices)")}
+    if 'source' not in existing:
+        conn.execute("ALTER TABLE devices ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+    conn.execute("DROP INDEX IF EXISTS idx_devices_ip_without_mac")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_devices_source_ip_without_mac
+        ON devices (source, ip_address) WHERE mac_address IS NULL
+    """)
+
+def normalize_mac_addresses(conn):
+    """Store MAC addresses lowercase and colon separated (Device.normalize_mac)
+
+    Rows whose MAC addresses only differed in format are merged into the
+    newest one, keeping their history and the earliest first_seen.
+    """
+    conn.execute("""
+        CREATE TEMP TABLE mac_merge AS
+        SELECT d.id AS old_id, k.keep_id, k.first_seen
+        FROM devices d
+        JOIN (
+            SELECT lower(replace(mac_address, '-', ':')) AS mac, MAX(id) AS keep_id, MIN(first_seen) AS first_seen
+            FROM devices WHERE mac_address IS NOT NULL
+            GROUP BY lower(replace(mac_address, '-', ':')) HAVING COUNT(*) > 1
+        ) k ON lower(replace(d.mac_address, '-', ':')) = k.mac
+    """)
+    merged = conn.execute("SELECT COUNT(*) FROM mac_merge WHERE old_id != keep_id").fetchone()[0]
+    conn.execute("""
+        UPDATE device_history SET device_id = (SELECT keep_id FROM mac_merge WHERE old_id = device_id)
+        WHERE device_id IN (SELECT old_id FROM mac_merge WHERE old_id != keep_id)
+    """)
+    for table, size in (('device_presence_hourly', 3600), ('device_presence_daily', 86400)):
+        conn.execute(f"""
+            INSERT INTO {table} (device_id, bucket_start, online_seconds, sightings, ip_changes)
+            SELECT m.keep_id, r.bucket_start, r.online_seconds, r.sightings, r.ip_changes
+            FROM {table} r JOIN mac_merge m ON r.device_id = m.old_id
+            WHERE m.old_id != m.keep_id
+            ON CONFLICT (device_id, bucket_start) DO UPDATE SET
+                online_seconds = MIN({size}, online_seconds + excluded.online_seconds),
+                sightings = sightings + excluded.sightings,
+                ip_changes = ip_changes + excluded.ip_changes
+        """)
+        conn.execute(f"DELETE FROM {table} WHERE device_id IN (SELECT old_id FROM mac_merge WHERE old_id != keep_id)")
+    conn.execute("""
+        UPDATE devices SET first_seen = (SELECT first_seen FROM mac_merge WHERE keep_id = devices.id LIMIT 1)
+        WHERE id IN (SELECT keep_id FROM mac_merge)
+    """)
+    conn.execute("DELETE FROM devices WHERE id IN (SELECT old_id FROM mac_merge WHERE old_id != keep_id)")
+    conn.execute("DROP TABLE mac_merge")
+    conn.execute("""
+        UPDATE devices SET mac_address = lower(replace(mac_address, '-', ':'))
+        WHERE mac_address != lower(replace(mac_address, '-', ':'))
+    """)
+    if merged:
+        # The dashboard counters are rebuilt from full queries on first use
+        conn.execute("DELETE FROM dashboard_stats")
+
+# Schema changes in order; a database's PRAGMA user_version is the number of migrations it has
+MIGRATIONS = [
+    ('add_enrichment_columns', add_columns),
+    ('key_macless_devices', key_macless_devices),
+    ('index_dashboard_queries', index_dashboard_queries),
+    ('add_presence_rollups', add_presence_rollups),
+    ('add_dashboard_stats', add_dashboard_stats),
+    ('reset_default_network_range', reset_default_network_range),
+    ('add_device_source', add_device_source),
+    ('normalize_mac_addresses', normalize_mac_addresses),
+]
+
+def upgrade_database(conn):
+    """Apply the migrations a database does not have yet, each in its own transaction
+
+    Returns the (version, name) of every migration applied.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # transactions are managed here, DDL included
+    applied = []
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, (name, migrate) in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            applied.append((number, name))
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
 if __name__ == '__main__':
     init_database()
@@ -2,7 +2,7 @@
 
 CREATE TABLE IF NOT EXISTS devices (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    ip_address VARCHAR(15) NOT NULL,
+    ip_address VARCHAR(45) NOT NULL,  -- IPv4, or IPv6 for IPv6-only hosts
     mac_address VARCHAR(17) UNIQUE,
     hostname VARCHAR(255),
     vendor VARCHAR(255),
@@ -11,13 +11,17 @@ CREATE TABLE IF NOT EXISTS devices (
     last_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
     is_active BOOLEAN DEFAULT 1,
     method VARCHAR(20),  -- ARP, ping, etc.
-    open_ports TEXT  -- JSON string of open ports
+    open_ports TEXT,  -- JSON string of open ports
+    hostname_checked_at DATETIME,  -- last reverse DNS lookup (incremental scans)
+    ports_checked_at DATETIME,  -- last port scan (incremental scans)
+    ipv6_addresses TEXT,  -- JSON list of IPv6 addresses seen for this MAC
+    services TEXT  -- JSON list of service fingerprints (port, service, banner, cn)
 );
 
 CREATE TABLE IF NOT EXISTS device_history (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     device_id INTEGER,
-    ip_address VARCHAR(15),
+    ip_address VARCHAR(45),
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
     status VARCHAR(20),
     method VARCHAR(20),  -- ARP, ping, etc.
@@ -39,9 +43,19 @@ CREATE TABLE IF NOT EXISTS settings (
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL
+);
+
+-- Indexes and later columns are added by the migrations in init_db.py
+
 -- Insert default settings
 INSERT OR IGNORE INTO settings (setting_name, setting_value) VALUES
-('network_range', '192.168.1.0/24'),
-('scan_interval', '300'),
+('network_range', 'auto'),  -- comma separated CIDRs, 'auto' uses Config.NETWORK_RANGE
+('scan_interval', '60'),  -- seconds between discovery sweeps
+('port_scan_interval', '3600'),
+('dns_refresh_interval', '86400'),
 ('auto_scan_enabled', 'true'),
 ('port_scan_enabled', 'true');
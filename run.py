@@ -7,9 +7,17 @@ from app import create_app, socketio
 app = create_app()
 
 if __name__ == '__main__':
-    # Initialize database if it doesn't exist
-    if not os.path.exists('data/network.db'):
-        from database.init_db import init_database
-        init_database()
+    # Initialize the database, or bring an existing one up to the current schema
+    from database.init_db import init_database
+    init_database()
 
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    debug = True
+
+    # Background work starts here rather than as a side effect of importing the app.
+    # In debug mode the werkzeug reloader's parent only watches files and the
+    # serving child (WERKZEUG_RUN_MAIN) runs the scheduler and scan worker
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.routes import start_background_tasks
+        start_background_tasks()
+
+    socketio.run(app, host='0.0.0.0', port=5000, debug=debug)
@@ -4,7 +4,6 @@ Database backup script for Network Dashboard
 Creates timestamped backups of the SQLite database
 """
 
-import shutil
 import datetime
 import os
 import sys
@@ -22,6 +21,23 @@ def create_backup_directory():
     backup_dir.mkdir(parents=True, exist_ok=True)
     return backup_dir
 
+def copy_database(source_path, target_path):
+    """
+    Copy a database through SQLite's backup API, which includes commits
+    still in the write-ahead log that a plain file copy would miss
+
+    Args:
+        source_path: Path to the database to copy
+        target_path: Path to write the copy to
+    """
+    source = sqlite3.connect(str(source_path))
+    target = sqlite3.connect(str(target_path))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
 def backup_database(db_path=None, backup_dir=None):
     """
     Create a backup of the database
@@ -55,7 +71,7 @@ def backup_database(db_path=None, backup_dir=None):
             print("Warning: Database integrity check failed, but proceeding with backup")
 
         # Create backup
-        shutil.copy2(db_path, backup_path)
+        copy_database(db_path, backup_path)
 
         # Verify backup
         if verify_backup(backup_path):
@@ -217,11 +233,11 @@ def restore_backup(backup_path, target_path=None):
         # Create backup of current database if it exists
         if os.path.exists(target_path):
             current_backup = f"{target_path}.pre_restore_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            shutil.copy2(target_path, current_backup)
+            copy_database(target_path, current_backup)
             print(f"Current database backed up to: {current_backup}")
 
         # Restore from backup
-        shutil.copy2(backup_path, target_path)
+        copy_database(backup_path, target_path)
         print(f"Database restored from: {backup_path}")
         return True
 
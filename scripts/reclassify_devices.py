@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Device reclassification script for Network Dashboard
+Re-applies the device rules file to every stored device
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from app.classifier import DeviceClassifier
+
+def reclassify(db_path, rules_path, dry_run=False, batch_size=5000):
+    """
+    Reclassify all devices in the database
+
+    Args:
+        db_path: Path to the database file
+        rules_path: Path to the device rules file
+        dry_run: Only report what would change
+        batch_size: Rows classified per batch
+
+    Returns:
+        int: Number of devices whose type changed
+    """
+    classifier = DeviceClassifier.from_file(rules_path)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    changed = 0
+    start = time.time()
+
+    rows = conn.execute("""
+        SELECT id, vendor, hostname, open_ports, services, device_type
+        FROM devices
+        WHERE device_type IS NULL OR device_type != 'This Device'
+    """).fetchall()
+
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        devices = []
+        for row in batch:
+            try:
+                open_ports = json.loads(row['open_ports']) if row['open_ports'] else []
+            except ValueError:
+                open_ports = []
+            try:
+                services = json.loads(row['services']) if row['services'] else []
+            except ValueError:
+                services = []
+            devices.append({
+                'vendor': row['vendor'],
+                'hostname': row['hostname'],
+                'open_ports': open_ports,
+                'services': services
+            })
+
+        updates = [
+            (device_type, row['id'])
+            for row, device_type in zip(batch, classifier.classify_many(devices))
+            if device_type != row['device_type']
+        ]
+        changed += len(updates)
+        if updates and not dry_run:
+            conn.executemany("UPDATE devices SET device_type = ? WHERE id = ?", updates)
+            conn.commit()
+
+    conn.close()
+    print(f"Classified {len(rows)} devices in {time.time() - start:.2f} seconds, {changed} changed"
+          + (" (dry run)" if dry_run else ""))
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard Device Reclassification Tool')
+    parser.add_argument('--db-path', default=Config.DATABASE_PATH, help='Path to database file')
+    parser.add_argument('--rules', default=Config.DEVICE_RULES_FILE, help='Path to device rules file')
+    parser.add_argument('--dry-run', action='store_true', help='Report changes without writing them')
+
+    args = parser.parse_args()
+    reclassify(args.db_path, args.rules, dry_run=args.dry_run)
+
+if __name__ == '__main__':
+    main()
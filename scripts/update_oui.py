@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+OUI registry refresh script for Network Dashboard
+Builds the local vendor index used for MAC vendor lookups
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from app.oui import OUIIndex
+
+IEEE_REGISTRIES = [
+    'https://standards-oui.ieee.org/oui/oui.csv',
+    'https://standards-oui.ieee.org/oui28/mam.csv',
+    'https://standards-oui.ieee.org/oui36/oui36.csv',
+]
+
+def download(url, timeout=60):
+    """
+    Download a registry file to a temporary path
+
+    Args:
+        url: Registry URL
+        timeout: Socket timeout in seconds
+
+    Returns:
+        str: Path to the downloaded file
+    """
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    request = urllib.request.Request(url, headers={'User-Agent': 'Network-Dashboard'})
+    with urllib.request.urlopen(request, timeout=timeout) as response, os.fdopen(fd, 'wb') as f:
+        while True:
+            chunk = response.read(65536)
+            if not chunk:
+                break
+            f.write(chunk)
+    return path
+
+def build_index(sources):
+    """
+    Build an index from local registry files
+
+    Args:
+        sources: Paths to oui.csv / mam.csv / oui36.csv / oui.txt or compact files
+
+    Returns:
+        OUIIndex: The merged index
+    """
+    index = OUIIndex()
+    for source in sources:
+        count = index.load(source)
+        print(f"Loaded {count} prefixes from {source}")
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description='Network Dashboard OUI Registry Tool')
+    parser.add_argument('--source', action='append', default=[],
+                       help='Local registry file to import (repeatable, skips the download)')
+    parser.add_argument('--output', default=Config.OUI_FILE,
+                       help='Where to write the vendor index')
+
+    args = parser.parse_args()
+
+    sources = list(args.source)
+    downloaded = []
+    if not sources:
+        # Online refresh straight from the IEEE registries
+        for url in IEEE_REGISTRIES:
+            print(f"Downloading {url}")
+            try:
+                downloaded.append(download(url))
+            except Exception as e:
+                print(f"Error downloading {url}: {e}")
+        sources = downloaded
+
+    if not sources:
+        print("No registry files available, index not updated")
+        sys.exit(1)
+
+    try:
+        index = build_index(sources)
+    finally:
+        for path in downloaded:
+            os.remove(path)
+
+    if not len(index):
+        print("No prefixes found, index not updated")
+        sys.exit(1)
+
+    index.save(args.output)
+    print(f"Wrote {len(index)} prefixes to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,8 @@ function filterDevices(devices, status, type, search) {
 				!(
 					(device.hostname && device.hostname.toLowerCase().includes(s)) ||
 					(device.ip_address && device.ip_address.toLowerCase().includes(s)) ||
+					(device.ipv6_addresses &&
+						device.ipv6_addresses.some((a) => a.toLowerCase().includes(s))) ||
 					(device.mac_address &&
 						device.mac_address.toLowerCase().includes(s)) ||
 					(device.vendor && device.vendor.toLowerCase().includes(s))
@@ -158,4 +160,18 @@ function setupSocketListeners() {
 		if (data.devices) updateDevicesTable(data.devices);
 		if (data.stats) updateDeviceSummary(data.stats);
 	});
+	// Devices stream in one at a time while a scan is running
+	socket.on("device_discovered", (device) => {
+		const index = allDevices.findIndex(
+			(d) =>
+				(device.mac_address && d.mac_address === device.mac_address) ||
+				(!device.mac_address && d.ip_address === device.ip_address),
+		);
+		if (index >= 0) {
+			allDevices[index] = { ...allDevices[index], ...device };
+		} else {
+			allDevices.push(device);
+		}
+		applyFiltersAndRender();
+	});
 }